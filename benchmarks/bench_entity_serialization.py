@@ -0,0 +1,65 @@
+"""
+Compares the previous asdict + json.dumps entity encoding with middleware.entity.entity_codec.
+
+Run from the project root with the application environment set:
+    python -m benchmarks.bench_entity_serialization [messages] [repeat]
+"""
+import json
+import sys
+import timeit
+
+from middleware.entity import entity_codec
+from middleware.entity.cache_entity import CacheEntity
+from middleware.entity.chat_history_entity import ChatHistoryEntity, ChatHistoryMessage
+from middleware.entity.entity_factory import base_entity_from_dict
+
+
+def asdict_encode(entities) -> bytes:
+    return json.dumps([
+        {key: value for key, value in entity.to_dict().items() if (value is not None and key != "technical_id")}
+        for entity in entities
+    ]).encode("utf-8")
+
+
+def json_decode(entity_model, data):
+    return [base_entity_from_dict(entity_model, tree) for tree in json.loads(data)]
+
+
+def build_chat_history(messages: int) -> ChatHistoryEntity:
+    entity = ChatHistoryEntity.empty(ChatHistoryEntity.generate_key("benchmark"))
+    for i in range(messages):
+        entity.add_message(ChatHistoryMessage(question=f"question {i} " * 10,
+                                              answer=f"answer {i} " * 50,
+                                              return_object="questions"))
+    return entity
+
+
+def build_cache_entity(size: int) -> CacheEntity:
+    value = {f"field_{i}": {"text": f"value {i}", "items": list(range(10))} for i in range(size)}
+    return CacheEntity.with_defaults(key="benchmark", value=value, ttl=3600)
+
+
+def report(name, number, func) -> None:
+    seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f"{name:<40} {seconds * 1000:10.3f} ms")
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    number = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    print(f"JSON backend: {'orjson' if entity_codec.orjson is not None else 'json'}")
+
+    for label, entities in (
+            (f"chat history ({messages} messages)", [build_chat_history(messages)]),
+            (f"cache entity ({messages} fields)", [build_cache_entity(messages)])):
+        entity_model = entities[0].get_meta()["entity_model"]
+        encoded = entity_codec.encode_entities(entities)
+        print(f"\n{label}, {len(encoded)} bytes")
+        report("encode asdict + json.dumps", number, lambda: asdict_encode(entities))
+        report("encode entity_codec", number, lambda: entity_codec.encode_entities(entities))
+        report("decode json.loads + from_dict", number, lambda: json_decode(entity_model, encoded))
+        report("decode entity_codec", number, lambda: entity_codec.decode_entities(entity_model, encoded))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Serialize and parse time per CloudEvent for the JSON text_data path and the binary_data paths
+(binary JSON and, when installed, msgpack), for calc responses carrying entity payloads of growing size.
+
+Run from the project root with the application environment set:
+    python -m benchmarks.bench_event_codec [repeat]
+"""
+import json
+import sys
+import timeit
+import uuid
+
+from cloudevents_pb2 import CloudEvent
+from middleware.grpc_client import event_codec
+
+
+def build_calc_response(messages: int) -> dict:
+    return {
+        "requestId": str(uuid.uuid4()),
+        "entityId": str(uuid.uuid4()),
+        "owner": "PLAY",
+        "payload": {
+            "key": "chat_history_entity_benchmark",
+            "messages": [{"question": f"question {i} " * 10, "answer": f"answer {i} " * 50,
+                          "return_object": "questions"} for i in range(messages)],
+        },
+        "success": True,
+    }
+
+
+def json_text_round_trip(data: dict) -> dict:
+    event = CloudEvent(id="1", source="bench", spec_version="1.0", type="bench", text_data=json.dumps(data))
+    parsed = CloudEvent.FromString(event.SerializeToString())
+    return json.loads(parsed.text_data)
+
+
+def binary_round_trip(data: dict, content_type: str) -> dict:
+    event = CloudEvent(id="1", source="bench", spec_version="1.0", type="bench")
+    event_codec.encode_event_data(event, data, reply_to=content_type)
+    return event_codec.decode_event_data(CloudEvent.FromString(event.SerializeToString()))
+
+
+def report(name: str, number: int, func, size: int) -> None:
+    seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f"{name:<24} {seconds * 1e6:12.1f} us/event {size:12d} bytes")
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    content_types = event_codec.supported_content_types()
+    for messages in (0, 10, 100, 1000):
+        data = build_calc_response(messages)
+        print(f"\ncalc response with {messages} messages")
+        text_size = len(CloudEvent(text_data=json.dumps(data)).SerializeToString())
+        report("json text_data", number, lambda: json_text_round_trip(data), text_size)
+        for content_type in content_types:
+            event = event_codec.encode_event_data(CloudEvent(), data, reply_to=content_type)
+            report(f"binary {content_type.split('/')[-1]}", number,
+                   lambda: binary_round_trip(data, content_type), len(event.SerializeToString()))
+
+
+if __name__ == "__main__":
+    main()
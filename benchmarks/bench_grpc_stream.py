@@ -0,0 +1,89 @@
+"""
+Drives consume_stream against the local CloudEventsService stand-in and reports sustained throughput,
+response latency percentiles and memory, for sizing GRPC_PROCESSOR_WORKERS before production.
+
+Calc requests go to a benchmark processor which sleeps --work-ms (I/O bound work, e.g. Cyoda calls)
+and then burns --cpu-ms of CPU. It is registered at runtime, so it runs in the thread pool.
+
+Run from the project root with the application environment set:
+    python -m benchmarks.bench_grpc_stream --rate 500 --requests 20000 --work-ms 20
+"""
+import argparse
+import asyncio
+import json
+import resource
+import time
+import tracemalloc
+
+from benchmarks.cloud_events_server import CloudEventsStandIn, start_server
+from middleware._auth.auth import TokenProvider
+from middleware.grpc_client import grpc_client
+from middleware.grpc_client.grpc_metrics import GrpcMetrics
+from middleware.repository.cyoda.entity.processor_registry import processor
+from middleware.repository.cyoda.entity.workflow import process_dispatch
+
+BENCHMARK_PROCESSOR = "benchmark_processor"
+
+
+def create_benchmark_processor(work_ms: float, cpu_ms: float, max_concurrency: int):
+    @processor(max_concurrency=max_concurrency)
+    def benchmark_processor(meta, data):
+        if work_ms > 0:
+            time.sleep(work_ms / 1000.0)
+        deadline = time.perf_counter() + cpu_ms / 1000.0
+        while time.perf_counter() < deadline:
+            pass
+        return data
+    return benchmark_processor
+
+
+async def run(args: argparse.Namespace) -> dict:
+    process_dispatch[BENCHMARK_PROCESSOR] = create_benchmark_processor(args.work_ms, args.cpu_ms,
+                                                                             args.max_concurrency)
+    # There is no Cyoda to log in to, processors get a placeholder token
+    provider = TokenProvider()
+    provider._token = "benchmark"
+    provider._expires_at = time.time() + 86400
+
+    servicer = CloudEventsStandIn(BENCHMARK_PROCESSOR, args.rate, args.requests, args.keep_alive_interval,
+                                  args.payload_size, content_type=args.content_type)
+    server, port = await start_server(servicer)
+    if args.trace_memory:
+        tracemalloc.start()
+    consumer = asyncio.create_task(grpc_client.consume_stream(f"127.0.0.1:{port}", secure=False))
+    try:
+        await servicer.done.wait()
+    finally:
+        consumer.cancel()
+        try:
+            await consumer
+        except asyncio.CancelledError:
+            pass
+        await server.stop(grace=1)
+
+    report = servicer.report()
+    report["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    if args.trace_memory:
+        report["python_peak_mb"] = tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0)
+        tracemalloc.stop()
+    report["outbound_queue"] = GrpcMetrics().snapshot()["outbound_queue"]
+    return report
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=200.0, help="calc requests per second")
+    parser.add_argument("--requests", type=int, default=5000, help="number of calc requests to send")
+    parser.add_argument("--keep-alive-interval", type=float, default=1.0, help="seconds between keep-alive events")
+    parser.add_argument("--payload-size", type=int, default=1024, help="bytes of payload per calc request")
+    parser.add_argument("--work-ms", type=float, default=10.0, help="simulated I/O time per request")
+    parser.add_argument("--cpu-ms", type=float, default=0.0, help="simulated CPU time per request")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="concurrency cap of the benchmark processor")
+    parser.add_argument("--content-type", choices=["application/json", "application/msgpack"],
+                        help="send binary_data payloads in this content type instead of JSON text_data")
+    parser.add_argument("--trace-memory", action="store_true", help="report peak Python allocations (slower)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    print(json.dumps(asyncio.run(run(parse_args())), indent=2))
@@ -0,0 +1,183 @@
+"""
+Local stand-in for the Cyoda CloudEventsService, for load testing the gRPC processor without a Cyoda environment.
+
+After a member joins, the server greets it, sends keep-alive events and calc requests at a fixed rate,
+and measures the time until each calc response and keep-alive ack comes back.
+
+Run standalone from the project root:
+    python -m benchmarks.cloud_events_server --port 50051 --rate 200 --requests 10000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+import grpc
+
+from cloudevents_pb2 import CloudEvent
+from cyoda_cloud_api_pb2_grpc import CloudEventsServiceServicer, add_CloudEventsServiceServicer_to_server
+from middleware.grpc_client.event_codec import (encode_event_data, decode_event_data, supported_content_types,
+                                                 ACCEPT_ATTRIBUTE)
+
+logger = logging.getLogger(__name__)
+
+SOURCE = "CloudEventsStandIn"
+SPEC_VERSION = "1.0"
+JOIN_EVENT_TYPE = "CalculationMemberJoinEvent"
+GREET_EVENT_TYPE = "CalculationMemberGreetEvent"
+KEEP_ALIVE_EVENT_TYPE = "CalculationMemberKeepAliveEvent"
+CALC_REQ_EVENT_TYPE = "EntityProcessorCalculationRequest"
+CALC_RESP_EVENT_TYPE = "EntityProcessorCalculationResponse"
+EVENT_ACK_TYPE = "EventAckResponse"
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class CloudEventsStandIn(CloudEventsServiceServicer):
+    """
+    Serves a single member at a time. Latencies are in milliseconds, from sending an event until
+    its response was received.
+    """
+
+    def __init__(self, processor_name: str, rate: float, requests: int, keep_alive_interval: float = 1.0,
+                 payload_size: int = 1024, drain_timeout: float = 30.0, content_type: Optional[str] = None):
+        self.processor_name = processor_name
+        self.rate = rate
+        self.requests = requests
+        self.keep_alive_interval = keep_alive_interval
+        self.payload = {"data": "x" * payload_size}
+        self.drain_timeout = drain_timeout
+        # None sends JSON text_data, a content type sends binary_data in it
+        self.content_type = content_type
+        self.calc_latencies = []
+        self.ack_latencies = []
+        self.started_at = None
+        self.finished_at = None
+        self.done = asyncio.Event()
+        self._pending = {}
+
+    def create_event(self, event_type: str, data: dict) -> CloudEvent:
+        event = CloudEvent(id=str(uuid.uuid4()), source=SOURCE, spec_version=SPEC_VERSION, type=event_type)
+        return encode_event_data(event, data, self.content_type)
+
+    def create_calc_request(self) -> CloudEvent:
+        request_id = str(uuid.uuid4())
+        self._pending[request_id] = time.perf_counter()
+        return self.create_event(CALC_REQ_EVENT_TYPE, {
+            "id": request_id,
+            "requestId": request_id,
+            "entityId": str(uuid.uuid4()),
+            "processorName": self.processor_name,
+            "payload": self.payload,
+        })
+
+    def create_keep_alive(self) -> CloudEvent:
+        event_id = str(uuid.uuid4())
+        event = CloudEvent(id=event_id, source=SOURCE, spec_version=SPEC_VERSION, type=KEEP_ALIVE_EVENT_TYPE)
+        # Members ack keep-alive events by the id in their data
+        encode_event_data(event, {"id": event_id}, self.content_type)
+        self._pending[event_id] = time.perf_counter()
+        return event
+
+    async def _read_member_events(self, request_iterator):
+        async for event in request_iterator:
+            data = decode_event_data(event) or {}
+            if event.type == CALC_RESP_EVENT_TYPE:
+                sent_at = self._pending.pop(data.get("requestId"), None)
+                if sent_at is not None:
+                    self.calc_latencies.append((time.perf_counter() - sent_at) * 1000.0)
+            elif event.type == EVENT_ACK_TYPE:
+                sent_at = self._pending.pop(data.get("sourceEventId"), None)
+                if sent_at is not None:
+                    self.ack_latencies.append((time.perf_counter() - sent_at) * 1000.0)
+            if len(self.calc_latencies) >= self.requests:
+                self.finished_at = time.perf_counter()
+                self.done.set()
+
+    async def startStreaming(self, request_iterator, context):
+        join_event = await request_iterator.__anext__()
+        logger.info(f"Member joined: {join_event.text_data}")
+        greet_event = self.create_event(GREET_EVENT_TYPE, {"memberId": str(uuid.uuid4())})
+        # Like a binary capable server, lets the member send large payloads binary
+        greet_event.attributes[ACCEPT_ATTRIBUTE].ce_string = ",".join(supported_content_types())
+        yield greet_event
+
+        reader = asyncio.create_task(self._read_member_events(request_iterator))
+        try:
+            self.started_at = time.perf_counter()
+            next_keep_alive = self.started_at + self.keep_alive_interval
+            for sent in range(self.requests):
+                # Requests are scheduled at fixed times, a slow member doesn't lower the offered rate
+                delay = self.started_at + sent / self.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if time.perf_counter() >= next_keep_alive:
+                    yield self.create_keep_alive()
+                    next_keep_alive += self.keep_alive_interval
+                yield self.create_calc_request()
+            try:
+                await asyncio.wait_for(self.done.wait(), self.drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"{len(self._pending)} events unanswered after {self.drain_timeout}s")
+                self.finished_at = time.perf_counter()
+                self.done.set()
+        finally:
+            reader.cancel()
+
+    def report(self) -> dict:
+        elapsed = (self.finished_at or time.perf_counter()) - (self.started_at or time.perf_counter())
+        return {
+            "requests": self.requests,
+            "responses": len(self.calc_latencies),
+            "elapsed_seconds": elapsed,
+            "responses_per_second": len(self.calc_latencies) / elapsed if elapsed > 0 else 0.0,
+            "calc_p50_ms": percentile(self.calc_latencies, 0.5),
+            "calc_p99_ms": percentile(self.calc_latencies, 0.99),
+            "calc_max_ms": max(self.calc_latencies, default=0.0),
+            "keep_alive_ack_p99_ms": percentile(self.ack_latencies, 0.99),
+        }
+
+
+async def start_server(servicer: CloudEventsStandIn, port: int = 0) -> Tuple[grpc.aio.Server, int]:
+    """Starts a plaintext server on localhost, port 0 picks a free port. Returns the server and its port."""
+    server = grpc.aio.server()
+    add_CloudEventsServiceServicer_to_server(servicer, server)
+    port = server.add_insecure_port(f"127.0.0.1:{port}")
+    await server.start()
+    return server, port
+
+
+async def serve(args: argparse.Namespace):
+    servicer = CloudEventsStandIn(args.processor, args.rate, args.requests, args.keep_alive_interval,
+                                  args.payload_size, content_type=args.content_type)
+    server, port = await start_server(servicer, args.port)
+    logger.info(f"CloudEventsService stand-in listening on 127.0.0.1:{port}")
+    await servicer.done.wait()
+    print(json.dumps(servicer.report(), indent=2))
+    await server.stop(grace=1)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=50051)
+    parser.add_argument("--processor", default="benchmark_processor", help="processorName of the calc requests")
+    parser.add_argument("--rate", type=float, default=100.0, help="calc requests per second")
+    parser.add_argument("--requests", type=int, default=1000, help="number of calc requests to send")
+    parser.add_argument("--keep-alive-interval", type=float, default=1.0, help="seconds between keep-alive events")
+    parser.add_argument("--payload-size", type=int, default=1024, help="bytes of payload per calc request")
+    parser.add_argument("--content-type", choices=["application/json", "application/msgpack"],
+                        help="send binary_data payloads in this content type instead of JSON text_data")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(parse_args()))
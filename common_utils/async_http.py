@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import weakref
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger('django')
+
+# An AsyncClient's connections belong to the event loop they were opened on, so there is one client per loop
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Returns the HTTP/2 client of the running event loop, all requests to a host share one connection."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        # Imported lazily, common_utils.config itself depends on common_utils.utils
+        from common_utils import config
+        # The client ignores its own limits and http2 arguments when given a transport
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(config.HTTP_READ_TIMEOUT, connect=config.HTTP_CONNECT_TIMEOUT),
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                limits=httpx.Limits(max_connections=config.HTTP_POOL_MAXSIZE,
+                                    max_keepalive_connections=config.HTTP_POOL_MAXSIZE),
+                retries=config.HTTP_MAX_RETRIES),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def close_async_client() -> None:
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _get_headers(token: str) -> dict:
+    token = f"Bearer {token}" if not token.startswith('Bearer') else token
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"{token}",
+    }
+
+
+async def send_get_request(token: str, api_url: str, path: str, params=None) -> Optional[httpx.Response]:
+    url = f"{api_url}/{path}"
+    try:
+        response = await get_async_client().get(url, headers=_get_headers(token), params=params)
+        logger.info(f"GET request to {url} successful.")
+        return response
+    except Exception as err:
+        logger.error(f"Error during GET request to {url}: {err}")
+        logger.exception("An exception occurred")
+        raise
+
+
+async def send_post_request(token: str, api_url: str, path: str, data=None, json=None) -> Optional[httpx.Response]:
+    url = f"{api_url}/{path}"
+    try:
+        response = await get_async_client().post(url, headers=_get_headers(token), content=data, json=json)
+        response.raise_for_status()  # Raise an error for bad status codes
+        logger.info(f"POST request to {url} successful.")
+        return response
+    except httpx.HTTPStatusError as http_err:
+        logger.error(f"HTTP error during POST request to {url}: {http_err}")
+        raise
+    except Exception as err:
+        logger.error(f"Error during POST request to {url}: {err}")
+        logger.exception("An exception occurred")
+        raise
+
+
+async def send_put_request(token: str, api_url: str, path: str, data=None, json=None) -> Optional[httpx.Response]:
+    url = f"{api_url}/{path}"
+    try:
+        response = await get_async_client().put(url, headers=_get_headers(token), content=data, json=json)
+        response.raise_for_status()  # Raise an error for bad status codes
+        logger.info(f"PUT request to {url} successful.")
+        return response
+    except httpx.HTTPStatusError as http_err:
+        logger.error(f"HTTP error during PUT request to {url}: {http_err}")
+        raise
+    except Exception as err:
+        logger.error(f"Error during PUT request to {url}: {err}")
+        logger.exception("An exception occurred")
+        raise
+
+
+async def send_delete_request(token: str, api_url: str, path: str) -> Optional[httpx.Response]:
+    url = f"{api_url}/{path}"
+    try:
+        response = await get_async_client().delete(url, headers=_get_headers(token))
+        response.raise_for_status()  # Raise an error for bad status codes
+        logger.info(f"DELETE request to {url} successful.")
+        return response
+    except httpx.HTTPStatusError as http_err:
+        logger.error(f"HTTP error during DELETE request to {url}: {http_err}")
+        raise
+    except Exception as err:
+        logger.error(f"Error during DELETE request to {url}: {err}")
+        logger.exception("An exception occurred")
+        raise
@@ -71,6 +71,15 @@ TRINO_CONNECTION_STRING = f"trino://{TRINO_USER}:{TRINO_PASSWORD}@{TRINO_CONNECT
 # Authentication
 CYODA_AUTH_ENDPOINT = get_env_var("CYODA_AUTH_ENDPOINT")
 ENABLE_AUTH = get_env_var("ENABLE_AUTH")
+# JWKS of the token issuer, tokens are verified locally when set together with the expected issuer and
+# audience (comma separated) and PyJWT is installed
+CYODA_AUTH_JWKS_URL = get_env_var("CYODA_AUTH_JWKS_URL", "")
+CYODA_AUTH_ISSUER = get_env_var("CYODA_AUTH_ISSUER", "")
+CYODA_AUTH_AUDIENCE = get_env_var("CYODA_AUTH_AUDIENCE", "")
+AUTH_JWKS_REFRESH_INTERVAL = int(get_env_var("AUTH_JWKS_REFRESH_INTERVAL", "3600"))
+AUTH_TOKEN_CACHE_TTL = int(get_env_var("AUTH_TOKEN_CACHE_TTL", "60"))
+# Operator token for the per-key cache entry metrics (X-Metrics-Token header), the endpoint is disabled if unset
+METRICS_ADMIN_TOKEN = get_env_var("METRICS_ADMIN_TOKEN", "")
 
 # API Keys
 OPENAI_API_KEY = get_env_var("OPENAI_API_KEY")
@@ -105,7 +114,22 @@ RESET_RAG_DATA = get_env_var("RESET_RAG_DATA")
 RESET_MEMORY = get_env_var("RESET_MEMORY")
 CACHE_STORE = get_env_var("CACHE_STORE")
 MEMORY_STORE = get_env_var("MEMORY_STORE")
-CACHE_DB = get_env_var("CACHE_DB")
+# CYODA or IN_MEMORY, normalized to the repository registry's upper case names
+CACHE_DB = (get_env_var("CACHE_DB") or "").upper()
+CACHE_NEGATIVE_TTL = int(get_env_var("CACHE_NEGATIVE_TTL", "30"))
+CACHE_FLUSH_INTERVAL = int(get_env_var("CACHE_FLUSH_INTERVAL", "10"))
+CACHE_FLUSH_BATCH_SIZE = int(get_env_var("CACHE_FLUSH_BATCH_SIZE", "50"))
+CACHE_FLUSH_DRAIN_ON_SHUTDOWN = get_env_var("CACHE_FLUSH_DRAIN_ON_SHUTDOWN", "true")
+CACHE_FLUSH_MAX_RETRIES = int(get_env_var("CACHE_FLUSH_MAX_RETRIES", "5"))
+CACHE_LOAD_TIMEOUT = int(get_env_var("CACHE_LOAD_TIMEOUT", "60"))
+CHAT_HISTORY_SEGMENT_SIZE = int(get_env_var("CHAT_HISTORY_SEGMENT_SIZE", "50"))
+
+# HTTP client settings
+HTTP_POOL_MAXSIZE = int(get_env_var("HTTP_POOL_MAXSIZE", "20"))
+HTTP_CONNECT_TIMEOUT = float(get_env_var("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(get_env_var("HTTP_READ_TIMEOUT", "60"))
+HTTP_MAX_RETRIES = int(get_env_var("HTTP_MAX_RETRIES", "3"))
+HTTP_RETRY_BACKOFF = float(get_env_var("HTTP_RETRY_BACKOFF", "0.3"))
 
 #cyoda app settings
 CYODA_REPO_URL = get_env_var("CYODA_REPO_URL")
@@ -114,5 +138,39 @@ CYODA_API_KEY = decoded_bytes_cyoda_api_key.decode("utf-8")
 decoded_bytes_cyoda_api_secret = base64.b64decode(get_env_var("CYODA_API_SECRET"))
 CYODA_API_SECRET = decoded_bytes_cyoda_api_secret.decode("utf-8")
 CYODA_ENTITY_VERSION = get_env_var("CYODA_ENTITY_VERSION", "1")
+# Workflow transition of cache write-backs of existing entities, "invalidate" is only sent by invalidate
+CYODA_SAVE_TRANSITION = get_env_var("CYODA_SAVE_TRANSITION", "update")
+# The chat history model with the segments field needs a version above CYODA_ENTITY_VERSION, a locked model
+# version can't be changed. Histories of CYODA_ENTITY_VERSION are still read until saved again.
+CYODA_CHAT_HISTORY_ENTITY_VERSION = get_env_var("CYODA_CHAT_HISTORY_ENTITY_VERSION",
+                                                str(int(CYODA_ENTITY_VERSION) + 1))
+CYODA_TOKEN_REFRESH_MARGIN = int(get_env_var("CYODA_TOKEN_REFRESH_MARGIN", "60"))
+CYODA_INIT_WORKERS = int(get_env_var("CYODA_INIT_WORKERS", "4"))
+CYODA_INIT_FINGERPRINT_PATH = get_env_var("CYODA_INIT_FINGERPRINT_PATH", "")
+# Most recently used keys whose technical id is remembered, so they are read by id instead of a search
+CYODA_TECHNICAL_ID_INDEX_SIZE = int(get_env_var("CYODA_TECHNICAL_ID_INDEX_SIZE", "10000"))
 CYODA_GRPC_ADDRESS = get_env_var("GRPC_ADDRESS")
 CYODA_GRPC_PROCESSOR_TAG = get_env_var("GRPC_PROCESSOR_TAG", "cyoda_ai_chat")
+CYODA_GRPC_PROCESSOR_WORKERS = int(get_env_var("GRPC_PROCESSOR_WORKERS", "8"))
+# Calc requests accepted beyond the busy workers before the stream stops being read
+CYODA_GRPC_PROCESSOR_QUEUE_SIZE = int(get_env_var("GRPC_PROCESSOR_QUEUE_SIZE", "100"))
+# Comma separated CPU bound processors, run in a process pool instead of threads
+CYODA_GRPC_PROCESS_POOL_PROCESSORS = [name.strip() for name in get_env_var("GRPC_PROCESS_POOL_PROCESSORS", "").split(",")
+                                      if name.strip()]
+CYODA_GRPC_PROCESSOR_TIMEOUT = float(get_env_var("GRPC_PROCESSOR_TIMEOUT", "30"))
+CYODA_GRPC_PROCESSOR_MAX_CONCURRENCY = int(get_env_var("GRPC_PROCESSOR_MAX_CONCURRENCY", "4"))
+CYODA_GRPC_PROCESSOR_FAILURE_THRESHOLD = int(get_env_var("GRPC_PROCESSOR_FAILURE_THRESHOLD", "5"))
+CYODA_GRPC_PROCESSOR_RESET_TIMEOUT = float(get_env_var("GRPC_PROCESSOR_RESET_TIMEOUT", "30"))
+# Per processor overrides, e.g. {"invalidate_chat_history": {"timeout": 120, "max_concurrency": 1}}
+CYODA_GRPC_PROCESSOR_SETTINGS = get_env_var("GRPC_PROCESSOR_SETTINGS", "")
+CYODA_GRPC_RECONNECT_BASE_DELAY = float(get_env_var("GRPC_RECONNECT_BASE_DELAY", "1"))
+CYODA_GRPC_RECONNECT_MAX_DELAY = float(get_env_var("GRPC_RECONNECT_MAX_DELAY", "60"))
+CYODA_GRPC_KEEPALIVE_TIME_MS = int(get_env_var("GRPC_KEEPALIVE_TIME_MS", "30000"))
+CYODA_GRPC_KEEPALIVE_TIMEOUT_MS = int(get_env_var("GRPC_KEEPALIVE_TIMEOUT_MS", "10000"))
+CYODA_GRPC_MAX_MESSAGE_SIZE = int(get_env_var("GRPC_MAX_MESSAGE_SIZE", "4194304"))
+# text (JSON text_data), json (binary JSON) or msgpack, for payloads of at least GRPC_BINARY_PAYLOAD_THRESHOLD bytes.
+# Binary encodings are only used if the server announced them in its greet event
+CYODA_GRPC_PAYLOAD_ENCODING = get_env_var("GRPC_PAYLOAD_ENCODING", "text")
+CYODA_GRPC_BINARY_PAYLOAD_THRESHOLD = int(get_env_var("GRPC_BINARY_PAYLOAD_THRESHOLD", "16384"))
+# none, gzip or deflate
+CYODA_GRPC_COMPRESSION = get_env_var("GRPC_COMPRESSION", "none")
@@ -0,0 +1,71 @@
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger('django')
+
+# PUT is left out on purpose: Cyoda entity updates run workflow transitions and are not safe to repeat.
+# Connection errors are retried for every method, the request was never sent in that case.
+RETRY_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "DELETE"])
+RETRY_STATUS_CODES = (502, 503, 504)
+
+_session = None
+_adapter = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Returns the process-wide keep-alive session used for all Cyoda REST calls."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _create_session()
+    return _session
+
+
+def get_timeout():
+    # Imported lazily, common_utils.config itself depends on common_utils.utils
+    from common_utils import config
+    return config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT
+
+
+def _create_session() -> requests.Session:
+    global _adapter
+    from common_utils import config
+    retry = Retry(
+        total=config.HTTP_MAX_RETRIES,
+        backoff_factor=config.HTTP_RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=RETRY_METHODS,
+        raise_on_status=False,
+    )
+    # pool_maxsize is the number of kept-alive connections per host, size it to the worker threads
+    _adapter = HTTPAdapter(pool_connections=10, pool_maxsize=config.HTTP_POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", _adapter)
+    session.mount("http://", _adapter)
+    logger.info(f"Created HTTP session with pool size {config.HTTP_POOL_MAXSIZE}")
+    return session
+
+
+def get_connection_stats() -> dict:
+    """Requests sent and connections opened per host; every request beyond the opened connections reused one."""
+    if _adapter is None:
+        return {}
+    stats = {}
+    pools = _adapter.poolmanager.pools
+    for pool_key in list(pools.keys()):
+        pool = pools.get(pool_key)
+        if pool is None:
+            continue
+        host = f"{pool.scheme}://{pool.host}:{pool.port}"
+        stats[host] = {
+            "requests": pool.num_requests,
+            "connections_opened": pool.num_connections,
+            "connections_reused": max(pool.num_requests - pool.num_connections, 0),
+        }
+    return stats
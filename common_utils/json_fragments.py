@@ -0,0 +1,153 @@
+import copy
+import json
+import logging
+from typing import Any, List, Optional
+
+from common_utils.json_repair import extract_json, resolve_ref
+from common_utils.schema_cache import get_compiled_schema
+
+logger = logging.getLogger('django')
+
+MAX_FRAGMENTS = 20
+
+
+def to_json_pointer(path) -> str:
+    return "".join("/" + str(part).replace("~", "~0").replace("/", "~1") for part in path)
+
+
+def _pointer_parts(pointer: str) -> List[str]:
+    if not pointer:
+        return []
+    if not pointer.startswith("/"):
+        raise ValueError(f"Invalid JSON pointer: {pointer}")
+    return [part.replace("~1", "/").replace("~0", "~") for part in pointer[1:].split("/")]
+
+
+def _is_within(pointer: str, ancestor: str) -> bool:
+    return pointer == ancestor or pointer.startswith(ancestor + "/")
+
+
+def _collect_definitions(schema: Any, root: dict, definitions: dict) -> None:
+    """Adds the local $ref targets used by the schema, transitively, so a sub-schema can be read on its own."""
+    if isinstance(schema, dict):
+        ref = schema.get("$ref")
+        if isinstance(ref, str) and ref.startswith("#") and ref not in definitions:
+            target = resolve_ref(schema, root)
+            if target is not schema:
+                definitions[ref] = target
+                _collect_definitions(target, root, definitions)
+        for value in schema.values():
+            _collect_definitions(value, root, definitions)
+    elif isinstance(schema, list):
+        for value in schema:
+            _collect_definitions(value, root, definitions)
+
+
+def get_failing_fragments(text: str, schema_path: str) -> Optional[List[dict]]:
+    """
+    The smallest parts of the document to send back for correction: for each failing location its JSON pointer,
+    the error messages, the current value and the sub-schema it must match. Errors nested in another failing
+    location are merged into it. Returns None if the document can't be parsed or the root itself is invalid,
+    then only a full retry helps.
+    """
+    compiled = get_compiled_schema(schema_path)
+    try:
+        document = extract_json(text)
+    except json.JSONDecodeError:
+        return None
+    fragments = {}
+    for error in sorted(compiled.validator.iter_errors(document), key=lambda e: len(e.path)):
+        for pointer, value, schema, missing in _error_locations(error, compiled.schema):
+            if not pointer:
+                return None
+            ancestor = next((known for known in fragments if _is_within(pointer, known)), None)
+            if ancestor is not None:
+                fragments[ancestor]["errors"].append(f"{pointer}: {error.message}")
+                continue
+            # A location can contain fragments registered before it, e.g. missing properties of an object
+            nested_errors = []
+            for nested in [known for known in fragments if _is_within(known, pointer)]:
+                nested_errors.extend(f"{nested}: {message}" for message in fragments.pop(nested)["errors"])
+            if len(fragments) >= MAX_FRAGMENTS:
+                return None
+            definitions = {}
+            _collect_definitions(schema, compiled.schema, definitions)
+            fragments[pointer] = {
+                "pointer": pointer,
+                "errors": [error.message] + nested_errors,
+                "value": value,
+                "missing": missing,
+                "schema": schema,
+                "definitions": definitions,
+            }
+    return list(fragments.values()) or None
+
+
+def _error_locations(error, root: dict) -> list:
+    """(pointer, value, schema, missing) to correct for a validation error."""
+    pointer = to_json_pointer(error.path)
+    if error.validator == "required" and isinstance(error.instance, dict):
+        # Only the missing properties are asked for, not the whole object holding them
+        properties = error.schema.get("properties", {}) if isinstance(error.schema, dict) else {}
+        return [(pointer + to_json_pointer([name]), None, resolve_ref(properties.get(name, {}), root), True)
+                for name in error.validator_value if name not in error.instance]
+    return [(pointer, error.instance, error.schema, False)]
+
+
+def build_fragment_retry_question(fragments: List[dict]) -> str:
+    parts = [
+        "Retry the last step. JSON validation failed for these parts of the DTO JSON. "
+        "Return only a JSON object mapping each JSON pointer below to its corrected value, "
+        "for example {\"/path/0\": {...}}. Do not return the whole document."
+    ]
+    for fragment in fragments:
+        part = (
+            f"\nJSON pointer: {fragment['pointer']}\n"
+            f"Errors: {'; '.join(fragment['errors'])}\n"
+            f"Current value: {'missing' if fragment['missing'] else json.dumps(fragment['value'])}\n"
+            f"Schema: {json.dumps(fragment['schema'])}"
+        )
+        if fragment["definitions"]:
+            part += f"\nReferenced definitions: {json.dumps(fragment['definitions'])}"
+        parts.append(part)
+    return "\n".join(parts)
+
+
+def _set_at_pointer(document: Any, pointer: str, value: Any) -> Any:
+    parts = _pointer_parts(pointer)
+    if not parts:
+        return value
+    target = document
+    for part in parts[:-1]:
+        target = target[int(part)] if isinstance(target, list) else target[part]
+    last = parts[-1]
+    if isinstance(target, list):
+        if last == "-":
+            target.append(value)
+        else:
+            target[int(last)] = value
+    else:
+        target[last] = value
+    return document
+
+
+def patch_fragments(text: str, fragments: List[dict], retry_result: str) -> str:
+    """
+    Applies the corrected fragments of the retry answer to the document and returns it as JSON text.
+    An answer which isn't a pointer map is taken as the whole corrected document.
+    """
+    try:
+        patches = extract_json(retry_result)
+    except json.JSONDecodeError:
+        return retry_result
+    pointers = {fragment["pointer"] for fragment in fragments}
+    if not isinstance(patches, dict) or not patches or not all(key in pointers for key in patches):
+        logger.info("Retry answer is not a fragment map, using it as the whole document.")
+        return json.dumps(patches)
+    document = copy.deepcopy(extract_json(text))
+    for pointer, value in patches.items():
+        try:
+            document = _set_at_pointer(document, pointer, value)
+        except (KeyError, IndexError, ValueError, TypeError) as e:
+            logger.warning(f"Could not patch {pointer}: {e}")
+    return json.dumps(document)
@@ -0,0 +1,176 @@
+import copy
+import json
+import logging
+import threading
+from typing import Any, Optional
+
+from common_utils.schema_cache import get_compiled_schema
+
+logger = logging.getLogger('django')
+
+_stats = {"attempts": 0, "retries_saved": 0}
+_stats_lock = threading.Lock()
+
+_TRUE_STRINGS = {"true", "yes", "1"}
+_FALSE_STRINGS = {"false", "no", "0"}
+
+
+def get_repair_stats() -> dict:
+    """Local repair attempts, and how many of them validated afterwards, i.e. LLM retries saved."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _increment(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def extract_json(text: str) -> Any:
+    """
+    Parses the first JSON object or array in the text, ignoring prose before and after it.
+    Raises json.JSONDecodeError if there is none.
+    """
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        error = e
+    decoder = json.JSONDecoder()
+    for index, char in enumerate(text):
+        if char in "{[":
+            try:
+                return decoder.raw_decode(text, index)[0]
+            except json.JSONDecodeError:
+                continue
+    raise error
+
+
+def resolve_ref(schema: Any, root: dict) -> Any:
+    """Follows local '#/...' $refs of the schema within the root schema."""
+    seen = 0
+    while isinstance(schema, dict) and isinstance(schema.get("$ref"), str) and schema["$ref"].startswith("#"):
+        target = root
+        for part in schema["$ref"][1:].strip("/").split("/"):
+            if not part:
+                continue
+            part = part.replace("~1", "/").replace("~0", "~")
+            if not isinstance(target, dict) or part not in target:
+                return schema
+            target = target[part]
+        schema = target
+        seen += 1
+        if seen > 32:
+            break
+    return schema
+
+
+def _expected_types(schema: dict) -> list:
+    types = schema.get("type")
+    if types is None:
+        return []
+    return types if isinstance(types, list) else [types]
+
+
+def _matches_type(value: Any, types: list) -> bool:
+    for expected in types:
+        if expected == "string" and isinstance(value, str) \
+                or expected == "boolean" and isinstance(value, bool) \
+                or expected == "integer" and isinstance(value, int) and not isinstance(value, bool) \
+                or expected == "number" and isinstance(value, (int, float)) and not isinstance(value, bool) \
+                or expected == "null" and value is None \
+                or expected == "object" and isinstance(value, dict) \
+                or expected == "array" and isinstance(value, list):
+            return True
+    return False
+
+
+def _coerce_scalar(value: Any, types: list) -> Any:
+    if _matches_type(value, types):
+        return value
+    if isinstance(value, str):
+        stripped = value.strip()
+        if "boolean" in types and stripped.lower() in _TRUE_STRINGS | _FALSE_STRINGS:
+            return stripped.lower() in _TRUE_STRINGS
+        if "integer" in types:
+            try:
+                return int(stripped)
+            except ValueError:
+                pass
+        if "number" in types:
+            try:
+                number = float(stripped)
+                return int(number) if number.is_integer() and "." not in stripped else number
+            except ValueError:
+                pass
+        if "null" in types and stripped.lower() in ("null", "none", ""):
+            return None
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        if "string" in types:
+            return str(value)
+        if "integer" in types and isinstance(value, float) and value.is_integer():
+            return int(value)
+    elif isinstance(value, bool) and "string" in types:
+        return "true" if value else "false"
+    return value
+
+
+def _coerce_enum(value: Any, enum: list) -> Any:
+    if value in enum or not isinstance(value, str):
+        return value
+    matches = [option for option in enum if isinstance(option, str) and option.lower() == value.strip().lower()]
+    return matches[0] if len(matches) == 1 else value
+
+
+def _repair(value: Any, schema: Any, root: dict) -> Any:
+    schema = resolve_ref(schema, root)
+    if not isinstance(schema, dict):
+        return value
+    types = _expected_types(schema)
+
+    if "array" in types and value is not None and not _matches_type(value, types):
+        value = [value]
+    elif types and "object" not in types and "array" not in types:
+        value = _coerce_scalar(value, types)
+    if "enum" in schema:
+        value = _coerce_enum(value, schema["enum"])
+
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        for name, property_schema in properties.items():
+            if name in value:
+                value[name] = _repair(value[name], property_schema, root)
+            else:
+                property_schema = resolve_ref(property_schema, root)
+                if isinstance(property_schema, dict) and "default" in property_schema:
+                    value[name] = copy.deepcopy(property_schema["default"])
+        additional = schema.get("additionalProperties")
+        if isinstance(additional, dict):
+            for name in value:
+                if name not in properties:
+                    value[name] = _repair(value[name], additional, root)
+    elif isinstance(value, list):
+        items = schema.get("items")
+        if isinstance(items, dict):
+            value = [_repair(item, items, root) for item in value]
+    return value
+
+
+def repair_json(text: str, schema_path: str) -> Optional[Any]:
+    """
+    Schema guided repair of mechanical mistakes in LLM output: prose around the JSON, a single object where an
+    array is expected, numbers and booleans given as strings (and the reverse), enum values in the wrong case,
+    and missing properties that have a default. Returns the repaired data if it then validates, None otherwise.
+    """
+    _increment("attempts")
+    try:
+        compiled = get_compiled_schema(schema_path)
+        data = _repair(extract_json(text), compiled.schema, compiled.schema)
+    except json.JSONDecodeError:
+        return None
+    except Exception as e:
+        logger.warning(f"Local JSON repair failed: {e}")
+        return None
+    if not compiled.validator.is_valid(data):
+        return None
+    _increment("retries_saved")
+    return data
@@ -0,0 +1,52 @@
+import json
+import os
+import threading
+from typing import NamedTuple
+
+import jsonschema
+
+
+class CompiledSchema(NamedTuple):
+    mtime_ns: int
+    size: int
+    schema: dict
+    validator: jsonschema.Draft7Validator
+    # Serialized once for retry prompts
+    schema_json: str
+
+
+_schemas = {}
+_lock = threading.Lock()
+
+
+def get_compiled_schema(file_path: str) -> CompiledSchema:
+    """
+    Returns the parsed schema and its Draft7Validator, built once per process and rebuilt when the file changes
+    (by mtime and size). Raises FileNotFoundError or json.JSONDecodeError like reading the file would.
+    """
+    path = os.path.abspath(file_path)
+    stat = os.stat(path)
+    compiled = _schemas.get(path)
+    if compiled is not None and compiled.mtime_ns == stat.st_mtime_ns and compiled.size == stat.st_size:
+        return compiled
+    with _lock:
+        compiled = _schemas.get(path)
+        if compiled is None or compiled.mtime_ns != stat.st_mtime_ns or compiled.size != stat.st_size:
+            with open(path, "r") as schema_file:
+                schema = json.load(schema_file)
+            compiled = CompiledSchema(mtime_ns=stat.st_mtime_ns, size=stat.st_size, schema=schema,
+                                      validator=jsonschema.Draft7Validator(schema), schema_json=json.dumps(schema))
+            _schemas[path] = compiled
+        return compiled
+
+
+def get_schema(file_path: str) -> dict:
+    return get_compiled_schema(file_path).schema
+
+
+def get_validator(file_path: str) -> jsonschema.Draft7Validator:
+    return get_compiled_schema(file_path).validator
+
+
+def get_schema_json(file_path: str) -> str:
+    return get_compiled_schema(file_path).schema_json
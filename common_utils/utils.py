@@ -17,6 +17,10 @@ import chardet
 
 import cairosvg
 
+from common_utils.http_session import get_session, get_timeout
+from common_utils.schema_cache import get_validator, get_schema_json
+from common_utils.json_repair import repair_json
+from common_utils.json_fragments import get_failing_fragments, build_fragment_retry_question, patch_fragments
 
 from langchain_community.document_loaders.pdf import PyPDFLoader
 from langchain_community.document_loaders.word_document import UnstructuredWordDocumentLoader
@@ -55,15 +59,13 @@ def parse_json(result: str) -> str:
 
 def validate_result(parsed_result: str, file_path: str) -> bool:
     try:
-        with open(file_path, "r") as schema_file:
-            schema = json.load(schema_file)
+        validator = get_validator(file_path)
     except (FileNotFoundError, json.JSONDecodeError) as e:
         logger.error(f"Error reading schema file {file_path}: {e}")
         raise
 
     try:
         json_data = json.loads(parsed_result)
-        validator = jsonschema.Draft7Validator(schema)
         errors = sorted(validator.iter_errors(json_data), key=lambda e: e.path)
 
         if errors:
@@ -116,7 +118,7 @@ def read_json_file(file_path: str):
         logger.error(f"JSON decoding failed for file {file_path}: {e}")
         raise
 
-def send_get_request(token: str, api_url: str, path: str) -> Optional[requests.Response]:
+def send_get_request(token: str, api_url: str, path: str, params=None) -> Optional[requests.Response]:
     url = f"{api_url}/{path}"
     token = f"Bearer {token}" if not token.startswith('Bearer') else token
     headers = {
@@ -124,7 +126,7 @@ def send_get_request(token: str, api_url: str, path: str) -> Optional[requests.R
         "Authorization": f"{token}",
     }
     try:
-        response = requests.get(url, headers=headers)
+        response = get_session().get(url, headers=headers, params=params, timeout=get_timeout())
         #todo response.raise_for_status()  # Raise an error for bad status codes
         logger.info(f"GET request to {url} successful.")
         return response
@@ -144,7 +146,7 @@ def send_post_request(token: str, api_url: str, path: str, data=None, json=None)
         "Authorization": f"{token}",
     }
     try:
-        response = requests.post(url, headers=headers, data=data, json=json)
+        response = get_session().post(url, headers=headers, data=data, json=json, timeout=get_timeout())
         response.raise_for_status()  # Raise an error for bad status codes
         logger.info(f"POST request to {url} successful.")
         return response
@@ -164,7 +166,7 @@ def send_put_request(token: str, api_url: str, path: str, data=None, json=None)
         "Authorization": f"{token}",
     }
     try:
-        response = requests.put(url, headers=headers, data=data, json=json)
+        response = get_session().put(url, headers=headers, data=data, json=json, timeout=get_timeout())
         response.raise_for_status()  # Raise an error for bad status codes
         logger.info(f"PUT request to {url} successful.")
         return response
@@ -184,7 +186,7 @@ def send_delete_request(token: str, api_url: str, path: str) -> Optional[request
         "Authorization": f"{token}",
     }
     try:
-        response = requests.delete(url, headers=headers)
+        response = get_session().delete(url, headers=headers, timeout=get_timeout())
         response.raise_for_status()  # Raise an error for bad status codes
         logger.info(f"GET request to {url} successful.")
         return response
@@ -273,20 +275,31 @@ def validate_and_parse_json(
             logger.warning(
                 f"JSON validation failed on attempt {attempt + 1} with error: {e.message}"
             )
-            try:
-                with open(schema_path, "r") as schema_file:
-                    schema = json.load(schema_file)
-            except (FileNotFoundError, json.JSONDecodeError) as e:
-                logger.error(f"Error reading schema file {schema_path}: {e}")
-                raise
+            repaired_data = repair_json(parsed_data, schema_path)
+            if repaired_data is not None:
+                logger.info("JSON repaired locally, no retry needed.")
+                return repaired_data
             if attempt < max_retries:
-                question = (
-                    f"Retry the last step. JSON validation failed with error: {e.message}. Correct this data: {parsed_data} "
-                    f"using this schema: {json.dumps(schema)}. "
-                    "Return only the DTO JSON."
-                )
-                retry_result = processor.ask_question(chat_id, question)
-                parsed_data = parse_json(retry_result)
+                fragments = get_failing_fragments(parsed_data, schema_path)
+                if fragments:
+                    # Only the failing parts and their sub-schemas are sent, the answer is patched in locally
+                    question = build_fragment_retry_question(fragments)
+                    retry_result = processor.ask_question(chat_id, question)
+                    parsed_data = patch_fragments(parsed_data, fragments, parse_json(retry_result))
+                else:
+                    question = (
+                        f"Retry the last step. JSON validation failed with error: {e.message}. Correct this data: {parsed_data} "
+                        f"using this schema: {get_schema_json(schema_path)}. "
+                        "Return only the DTO JSON."
+                    )
+                    retry_result = processor.ask_question(chat_id, question)
+                    parsed_data = parse_json(retry_result)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Invalid JSON on attempt {attempt + 1}: {e}")
+            repaired_data = repair_json(parsed_data, schema_path)
+            if repaired_data is not None:
+                logger.info("JSON repaired locally, no retry needed.")
+                return repaired_data
         except Exception as e:
             logger.exception("An exception occurred")
             logger.error("Maximum retry attempts reached. Validation failed.")
@@ -1,6 +1,8 @@
+import dataclasses
 import logging
 from abc import ABC, abstractmethod
-from typing import List
+from itertools import islice
+from typing import List, Iterator, Optional
 
 from langchain_core.messages import BaseMessage
 
@@ -46,8 +48,9 @@ class ConfigInteractor(ABC):
 
             key = ChatHistoryEntity.generate_key(chat_id)
             meta = self._get_cache_meta(token, key, ChatHistoryEntity)
-            if self.cache_service.contains_key(meta, key):
-                self.cache_service.invalidate(meta, [key])
+            user_chat_history = self.cache_service.get(meta, key)
+            if user_chat_history is not None:
+                self.cache_service.invalidate(meta, [key] + user_chat_history.get_segment_keys())
             return {"success": True, "message": f"Chat context with id {chat_id} cleared."}
         except Exception as e:
             logger.exception("An exception occurred")
@@ -73,6 +76,18 @@ class ConfigInteractor(ABC):
         if init_user_chat_history is not None:
             update_key = ChatHistoryEntity.generate_key(update_chat_id)
             meta = self._get_cache_meta(token, update_key, ChatHistoryEntity)
+            # Segments keep their index, a missing one must not shift the ones after it
+            for index, init_segment_key in enumerate(init_user_chat_history.get_segment_keys()):
+                segment = self.cache_service.get(self._get_cache_meta(token, init_segment_key, ChatHistoryEntity),
+                                                 init_segment_key)
+                if segment is None:
+                    logger.warning(f"Chat history segment '{init_segment_key}' not found")
+                    continue
+                segment_key = ChatHistoryEntity.generate_segment_key(update_key, index)
+                segment.key = segment_key
+                segment.is_dirty = True
+                self.cache_service.put_and_write_back(self._get_cache_meta(token, segment_key, ChatHistoryEntity),
+                                                      segment)
             update_user_chat_history = init_user_chat_history
             update_user_chat_history.key = update_key
             update_user_chat_history.is_dirty = True
@@ -106,6 +121,24 @@ class ConfigInteractor(ABC):
         message_history = self.cache_service.get(meta, key)
         return message_history
 
+    def iter_user_chat_messages(self, token, chat_id) -> Iterator[ChatHistoryMessage]:
+        """Yields the user chat messages newest first, sealed segments are only read once reached."""
+        user_chat_history = self.get_user_chat_history(token, chat_id)
+        if user_chat_history is None:
+            return
+        yield from reversed(user_chat_history.messages)
+        for segment in self._get_user_chat_history_segments(token, user_chat_history, newest_first=True):
+            yield from reversed(segment.messages)
+
+    def load_user_chat_history(self, token, chat_id, limit: Optional[int] = None) -> Optional[ChatHistoryEntity]:
+        """Returns the user chat history with the last `limit` messages (all by default) in chronological order."""
+        user_chat_history = self.get_user_chat_history(token, chat_id)
+        if user_chat_history is None:
+            return None
+        messages = list(islice(self.iter_user_chat_messages(token, chat_id), limit))
+        messages.reverse()
+        return dataclasses.replace(user_chat_history, messages=messages)
+
     def add_user_chat_hitory(self, token, chat_id, question, answer, return_object):
         user_chat_history = self.get_user_chat_history(token, chat_id)
         key = ChatHistoryEntity.generate_key(chat_id)
@@ -115,6 +148,10 @@ class ConfigInteractor(ABC):
         else:
             user_chat_history = ChatHistoryEntity.empty(key)
             user_chat_history.add_message(ChatHistoryMessage(question, answer, return_object))
+        # A full tail is written once as a segment, the history entity itself keeps a bounded size
+        segment = user_chat_history.seal_segment()
+        if segment is not None:
+            self.cache_service.put_and_write_back(self._get_cache_meta(token, segment.key, ChatHistoryEntity), segment)
         meta = self._get_cache_meta(token, key, ChatHistoryEntity)
         self.cache_service.put(meta, user_chat_history)
 
@@ -139,6 +176,17 @@ class ConfigInteractor(ABC):
         user_chat_history = self.cache_service.get(meta, chat_id)
         return user_chat_history
 
+    def _get_user_chat_history_segments(self, token, user_chat_history: ChatHistoryEntity,
+                                        newest_first=False) -> Iterator[ChatHistoryEntity]:
+        segment_keys = user_chat_history.get_segment_keys()
+        for segment_key in (reversed(segment_keys) if newest_first else segment_keys):
+            meta = self._get_cache_meta(token, segment_key, ChatHistoryEntity)
+            segment = self.cache_service.get(meta, segment_key)
+            if segment is None:
+                logger.warning(f"Chat history segment '{segment_key}' not found")
+                continue
+            yield segment
+
     @staticmethod
     def _get_cache_meta(token, chat_id, entity):
         meta = {"token": token}
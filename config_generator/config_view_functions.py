@@ -239,7 +239,7 @@ def get_user_chat_history(request, interactor: ConfigInteractor, chat_id_prefix)
             status=status.HTTP_400_BAD_REQUEST,
         )
     try:
-        user_chat_history = interactor.get_user_chat_history(token, chat_id)
+        user_chat_history = interactor.load_user_chat_history(token, chat_id)
         logger.info("Context cleared for chat_id: %s", chat_id)
         return Response({"success": True, "message": user_chat_history.to_dict() if user_chat_history else []}, status=status.HTTP_200_OK)
     except Exception as e:
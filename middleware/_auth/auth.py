@@ -1,5 +1,10 @@
+import base64
 import json
 import logging
+import threading
+import time
+from typing import Optional
+
 import requests
 
 from common_utils import config
@@ -28,4 +33,77 @@ def authenticate():
 
     except Exception as e:
         logger.error(f"An error occurred: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+# Used when the token carries no readable expiry
+DEFAULT_TOKEN_TTL = 300
+RETRY_REFRESH_DELAY = 30
+
+
+def get_token_expiry(token: str) -> Optional[float]:
+    """Returns the 'exp' claim (epoch seconds) of a JWT without verifying it, None if it has none."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload)).get("exp"))
+    except Exception:
+        return None
+
+
+class TokenProvider:
+    """
+    Caches the service account token and refreshes it in the background
+    CYODA_TOKEN_REFRESH_MARGIN seconds before it expires, at most half its lifetime before.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(TokenProvider, cls).__new__(cls)
+                    cls._instance._token = None
+                    cls._instance._expires_at = 0.0
+                    cls._instance._token_lock = threading.Lock()
+                    cls._instance._refresh_timer = None
+        return cls._instance
+
+    def get_token(self) -> Optional[str]:
+        with self._token_lock:
+            if self._token is None or time.time() >= self._expires_at:
+                self._refresh()
+            return self._token
+
+    def invalidate(self) -> None:
+        """Forces a new login on the next get_token, e.g. after the token was rejected."""
+        with self._token_lock:
+            self._token = None
+
+    def _refresh(self) -> None:
+        token = authenticate()
+        if token is None:
+            self._schedule_refresh(RETRY_REFRESH_DELAY)
+            return
+        self._token = token
+        self._expires_at = get_token_expiry(token) or time.time() + DEFAULT_TOKEN_TTL
+        lifetime = self._expires_at - time.time()
+        # A token living shorter than the margin would otherwise be refreshed every second
+        self._schedule_refresh(lifetime - min(config.CYODA_TOKEN_REFRESH_MARGIN, lifetime / 2))
+
+    def _schedule_refresh(self, delay: float) -> None:
+        if self._refresh_timer is not None:
+            self._refresh_timer.cancel()
+        self._refresh_timer = threading.Timer(max(delay, 1.0), self._background_refresh)
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+
+    def _background_refresh(self) -> None:
+        logger.info("Refreshing Cyoda service token.")
+        with self._token_lock:
+            self._refresh()
+
+
+def get_service_token() -> Optional[str]:
+    return TokenProvider().get_token()
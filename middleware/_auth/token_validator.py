@@ -0,0 +1,129 @@
+import hashlib
+import logging
+import threading
+import time
+from typing import Optional
+
+from common_utils import config
+from common_utils.http_session import get_session, get_timeout
+from middleware._auth.auth import get_token_expiry
+
+try:
+    import jwt
+except ImportError:  # pragma: no cover - without PyJWT every token is validated by the auth endpoint
+    jwt = None
+
+logger = logging.getLogger('django')
+
+MAX_CACHED_TOKENS = 10000
+# A token signed with an unknown key id refreshes the signing keys at most this often (seconds)
+MIN_JWKS_REFRESH_INTERVAL = 60
+
+
+def _strip_bearer(token: str) -> str:
+    return token[len("Bearer "):].strip() if token.startswith("Bearer ") else token.strip()
+
+
+class TokenValidator:
+    """
+    Validates request tokens for TokenValidationMiddleware. Valid tokens are remembered by their sha256 hash
+    until they expire, so a token only reaches the auth endpoint once. JWTs are verified locally against the
+    issuer's signing keys (CYODA_AUTH_JWKS_URL), issuer (CYODA_AUTH_ISSUER) and audience (CYODA_AUTH_AUDIENCE)
+    when all three are configured and PyJWT is installed; the keys are fetched once per
+    AUTH_JWKS_REFRESH_INTERVAL. Tokens which can't be verified locally fall back to the auth endpoint.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(TokenValidator, cls).__new__(cls)
+                    cls._instance._valid_tokens = {}
+                    cls._instance._tokens_lock = threading.Lock()
+                    cls._instance._signing_keys = {}
+                    cls._instance._keys_fetched_at = 0.0
+                    cls._instance._keys_lock = threading.Lock()
+        return cls._instance
+
+    def is_valid(self, token: str) -> bool:
+        """Raises requests.exceptions.RequestException if the auth endpoint can't be reached."""
+        token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        with self._tokens_lock:
+            expires_at = self._valid_tokens.get(token_hash)
+            if expires_at is not None:
+                if time.time() < expires_at:
+                    return True
+                del self._valid_tokens[token_hash]
+
+        valid = self._verify_locally(token)
+        if valid is None:
+            valid = self._verify_remotely(token)
+        if valid:
+            self._remember(token_hash, token)
+        return valid
+
+    def _remember(self, token_hash: str, token: str) -> None:
+        now = time.time()
+        expires_at = get_token_expiry(_strip_bearer(token)) or now + config.AUTH_TOKEN_CACHE_TTL
+        with self._tokens_lock:
+            if len(self._valid_tokens) >= MAX_CACHED_TOKENS:
+                self._valid_tokens = {key: value for key, value in self._valid_tokens.items() if value > now}
+                if len(self._valid_tokens) >= MAX_CACHED_TOKENS:
+                    # Drop the oldest entry
+                    del self._valid_tokens[next(iter(self._valid_tokens))]
+            self._valid_tokens[token_hash] = expires_at
+
+    def _verify_locally(self, token: str) -> Optional[bool]:
+        """Returns None when the token can't be verified locally."""
+        # A signature alone doesn't tell whether the token was issued for this service
+        audience = [value.strip() for value in config.CYODA_AUTH_AUDIENCE.split(",") if value.strip()]
+        if jwt is None or not config.CYODA_AUTH_JWKS_URL or not config.CYODA_AUTH_ISSUER or not audience:
+            return None
+        raw_token = _strip_bearer(token)
+        try:
+            header = jwt.get_unverified_header(raw_token)
+        except jwt.InvalidTokenError:
+            # Not a JWT
+            return None
+        signing_key = self._get_signing_key(header.get("kid"))
+        if signing_key is None:
+            return None
+        try:
+            jwt.decode(raw_token, signing_key.key, algorithms=[signing_key.algorithm_name],
+                       audience=audience, issuer=config.CYODA_AUTH_ISSUER,
+                       options={"require": ["exp", "iss", "aud"]})
+            return True
+        except jwt.InvalidTokenError as e:
+            logger.info(f"Token rejected by local verification: {e}")
+            return False
+
+    def _get_signing_key(self, kid):
+        with self._keys_lock:
+            age = time.time() - self._keys_fetched_at
+            if age > config.AUTH_JWKS_REFRESH_INTERVAL or (kid not in self._signing_keys
+                                                           and age > MIN_JWKS_REFRESH_INTERVAL):
+                self._refresh_signing_keys()
+            if kid is None and len(self._signing_keys) == 1:
+                return next(iter(self._signing_keys.values()))
+            return self._signing_keys.get(kid)
+
+    def _refresh_signing_keys(self) -> None:
+        try:
+            response = get_session().get(config.CYODA_AUTH_JWKS_URL, timeout=get_timeout())
+            response.raise_for_status()
+            jwk_set = jwt.PyJWKSet.from_dict(response.json())
+            self._signing_keys = {key.key_id: key for key in jwk_set.keys}
+            self._keys_fetched_at = time.time()
+            logger.info(f"Loaded {len(self._signing_keys)} token signing keys.")
+        except Exception as e:
+            # Keep the previous keys and retry after MIN_JWKS_REFRESH_INTERVAL
+            self._keys_fetched_at = time.time() - config.AUTH_JWKS_REFRESH_INTERVAL + MIN_JWKS_REFRESH_INTERVAL
+            logger.error(f"Error refreshing token signing keys: {e}")
+
+    @staticmethod
+    def _verify_remotely(token: str) -> bool:
+        url = f"{config.API_URL}/{config.CYODA_AUTH_ENDPOINT}"
+        response = get_session().get(url, headers={"Authorization": token}, timeout=get_timeout())
+        return response.status_code == 200
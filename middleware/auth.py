@@ -2,11 +2,8 @@ import logging
 import re
 import requests
 from django.http import HttpResponseForbidden
-from common_utils.config import (
-    ENABLE_AUTH,
-    CYODA_AUTH_ENDPOINT,
-    API_URL
-)
+from common_utils.config import ENABLE_AUTH
+from middleware._auth.token_validator import TokenValidator
 
 logger = logging.getLogger('django')
 
@@ -15,6 +12,7 @@ class TokenValidationMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
         self.api_v1_regex = re.compile(r"^/api/v1/.*")
+        self.token_validator = TokenValidator()
 
     def __call__(self, request):
         if not self.api_v1_regex.match(request.path) or ENABLE_AUTH == "false":
@@ -23,11 +21,8 @@ class TokenValidationMiddleware:
         token = request.headers.get("Authorization")
         if not token:
             return HttpResponseForbidden("No token provided")
-        headers = {"Authorization": token}
         try:
-            url = f"{API_URL}/{CYODA_AUTH_ENDPOINT}"
-            response = requests.get(url, headers=headers, timeout=10)
-            if response.status_code != 200:
+            if not self.token_validator.is_valid(token):
                 return HttpResponseForbidden("Invalid token")
         except requests.exceptions.RequestException as e:
             logger.error("Error validating token: %s", e)
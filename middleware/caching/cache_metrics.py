@@ -0,0 +1,112 @@
+import pickle
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from common_utils.utils import now
+
+UNKNOWN_ENTITY_MODEL = "unknown"
+MAX_TRACKED_ENTRIES = 10000
+
+
+def entity_model_of(meta: Any) -> str:
+    if isinstance(meta, dict):
+        return meta.get("entity_model") or UNKNOWN_ENTITY_MODEL
+    return UNKNOWN_ENTITY_MODEL
+
+
+class CacheMetrics:
+    """
+    Thread-safe per entity model counters and repository latencies of a caching service.
+    Also tracks when each key was put, so cache entries can be inspected by age.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(lambda: defaultdict(int))
+        self._latencies = defaultdict(dict)
+        self._entries = {}
+
+    def increment(self, entity_model: str, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[entity_model][name] += value
+
+    def record_latency(self, entity_model: str, operation: str, elapsed_ms: float) -> None:
+        with self._lock:
+            latency = self._latencies[entity_model].setdefault(
+                operation, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            latency["count"] += 1
+            latency["total_ms"] += elapsed_ms
+            latency["max_ms"] = max(latency["max_ms"], elapsed_ms)
+
+    @contextmanager
+    def timed(self, entity_model: str, operation: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_latency(entity_model, operation, (time.perf_counter() - start) * 1000.0)
+
+    def track_entry(self, entity_model: str, key: str, ttl: Any) -> None:
+        with self._lock:
+            if len(self._entries) >= MAX_TRACKED_ENTRIES:
+                self._prune_expired_entries()
+            self._entries[key] = {"entity_model": entity_model, "put_at": now(), "ttl": ttl}
+
+    def untrack_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._entries.pop(key, None)
+
+    def is_tracked(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def inspect(self, key: str, entity: Any) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            entry = dict(entry) if entry else None
+        if entity is None and entry is None:
+            return None
+        info = {
+            "key": key,
+            "cached": entity is not None,
+            "entity_model": entry["entity_model"] if entry else UNKNOWN_ENTITY_MODEL,
+            "ttl": entry["ttl"] if entry else None,
+            "age_seconds": (now() - entry["put_at"]) / 1000.0 if entry else None,
+        }
+        if entity is not None:
+            # Django's local memory cache stores pickled values, so this is the size the entry occupies
+            info["size_bytes"] = len(pickle.dumps(entity, pickle.HIGHEST_PROTOCOL))
+            info["is_dirty"] = getattr(entity, "is_dirty", None)
+        return info
+
+    def snapshot(self, gauges: Optional[Dict[str, Dict[str, int]]] = None) -> Dict[str, Any]:
+        with self._lock:
+            entries_by_model = defaultdict(int)
+            for entry in self._entries.values():
+                entries_by_model[entry["entity_model"]] += 1
+            models = set(self._counters) | set(self._latencies) | set(entries_by_model) | set(gauges or {})
+            result = {}
+            for entity_model in sorted(models):
+                model_metrics = dict(self._counters.get(entity_model, {}))
+                model_metrics["tracked_entries"] = entries_by_model.get(entity_model, 0)
+                model_metrics.update((gauges or {}).get(entity_model, {}))
+                model_metrics["repository_latency"] = {
+                    operation: {
+                        "count": latency["count"],
+                        "avg_ms": latency["total_ms"] / latency["count"] if latency["count"] else 0.0,
+                        "max_ms": latency["max_ms"],
+                    }
+                    for operation, latency in self._latencies.get(entity_model, {}).items()
+                }
+                result[entity_model] = model_metrics
+            return result
+
+    def _prune_expired_entries(self) -> None:
+        current_time = now()
+        expired_keys = [key for key, entry in self._entries.items()
+                        if isinstance(entry["ttl"], (int, float)) and entry["put_at"] + entry["ttl"] * 1000 < current_time]
+        for key in expired_keys:
+            del self._entries[key]
@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from enum import Enum
-from typing import Any, Optional, List
+from typing import Any, Optional, List, Dict
 
 from middleware.entity.cache_entity import CacheEntity
 from middleware.entity.cacheable_entity import CacheableEntity
@@ -55,3 +55,11 @@ class CachingService(ABC):
     @abstractmethod
     def refresh(self, meta: Any, key: str) -> bool:
         pass
+
+    @abstractmethod
+    def get_metrics(self) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    def inspect(self, key: str) -> Optional[Dict[str, Any]]:
+        pass
@@ -1,9 +1,10 @@
 import threading
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Dict
 
 import logging
 
 from common_utils.utils import now
+from middleware.caching.cache_metrics import CacheMetrics, entity_model_of
 from middleware.caching.caching_service import CachingService
 from django.core.cache import cache
 
@@ -25,6 +26,7 @@ class InMemoryCachingService(CachingService):
                     cls._instance = super(InMemoryCachingService, cls).__new__(cls)
                     cls._instance.cache = cache  # Initialize cache storage
                     cls._instance.repository = repository
+                    cls._instance.metrics = CacheMetrics()
         return cls._instance
 
     def __init__(self, *args, **kwargs):
@@ -33,18 +35,29 @@ class InMemoryCachingService(CachingService):
     def put_and_write_back(self, meta, entity: CacheableEntity) -> bool:
         self.cache.set(entity.get_key(), entity)
         self.cache.touch(entity.get_key(), entity.get_ttl())
+        self.metrics.track_entry(entity_model_of(meta), entity.get_key(), entity.get_ttl())
         return True
 
     def put(self, meta, entity: CacheableEntity) -> bool:
         self.cache.set(entity.get_key(), entity)
         self.cache.touch(entity.get_key(), entity.get_ttl())
+        self.metrics.track_entry(entity_model_of(meta), entity.get_key(), entity.get_ttl())
         return True
 
     def get(self, meta: Any, key: str) -> Optional[CacheableEntity]:
-        return self.cache.get(key)
-
+        entity_model = entity_model_of(meta)
+        entity = self.cache.get(key)
+        if entity is None:
+            if self.metrics.untrack_entry(key) is not None:
+                # The entry was put but the cache no longer holds it: expired or culled
+                self.metrics.increment(entity_model, "evictions")
+            self.metrics.increment(entity_model, "misses")
+        else:
+            self.metrics.increment(entity_model, "hits")
+        return entity
 
     def remove(self, key: str) -> bool:
+        self.metrics.untrack_entry(key)
         return self.cache.delete(key)
 
     def clear(self) -> None:
@@ -55,6 +68,9 @@ class InMemoryCachingService(CachingService):
 
     def invalidate(self, meta: Any, keys: List[str]) -> bool:
         self.cache.delete_many(keys)
+        for key in keys:
+            self.metrics.untrack_entry(key)
+        self.metrics.increment(entity_model_of(meta), "invalidations", len(keys))
         return True
 
     def invalidate_all(self) -> None:
@@ -65,6 +81,7 @@ class InMemoryCachingService(CachingService):
             if entity.is_dirty:
                 entity.is_dirty = False
                 self.cache.set(entity.get_key(), entity)
+        self.metrics.increment(entity_model_of(meta), "write_back_batches")
         return True
 
     def flush_dirty_entries(self, meta) -> None:
@@ -77,4 +94,10 @@ class InMemoryCachingService(CachingService):
             entity.last_modified = now()  # Update with current timestamp
             entity.is_dirty = False
             return True
-        return False
\ No newline at end of file
+        return False
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return self.metrics.snapshot()
+
+    def inspect(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.metrics.inspect(key, self.cache.get(key))
@@ -1,9 +1,18 @@
+import atexit
 import threading
-from typing import Optional, List, Any
+from collections import OrderedDict
+from typing import Optional, List, Any, Dict
 
 import logging
 
+from common_utils.config import (CACHE_NEGATIVE_TTL,
+                                 CACHE_FLUSH_INTERVAL,
+                                 CACHE_FLUSH_BATCH_SIZE,
+                                 CACHE_FLUSH_DRAIN_ON_SHUTDOWN,
+                                 CACHE_FLUSH_MAX_RETRIES,
+                                 CACHE_LOAD_TIMEOUT)
 from common_utils.utils import now
+from middleware.caching.cache_metrics import CacheMetrics, entity_model_of
 from middleware.caching.caching_service import CachingService
 from django.core.cache import cache
 
@@ -12,6 +21,17 @@ from middleware.repository.crud_repository import CrudRepository
 
 logger = logging.getLogger('django')
 
+NEGATIVE_ENTRY_PREFIX = "__negative__"
+
+
+class _InFlightLoad:
+    """Repository lookup of a single key shared by all concurrent callers missing that key."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entity = None
+        self.error = None
+
 
 class PersistentCachingService(CachingService):
     _instance = None
@@ -25,6 +45,10 @@ class PersistentCachingService(CachingService):
                     cls._instance = super(PersistentCachingService, cls).__new__(cls)
                     cls._instance.cache = cache  # Initialize cache storage
                     cls._instance.repository = repository
+                    cls._instance.metrics = CacheMetrics()
+                    cls._instance._in_flight = {}
+                    cls._instance._in_flight_lock = threading.Lock()
+                    cls._instance._init_write_back_flusher()
         return cls._instance
 
     def __init__(self, *args, **kwargs):
@@ -38,18 +62,31 @@ class PersistentCachingService(CachingService):
     def put(self, meta, entity: CacheableEntity) -> bool:
         self.cache.set(entity.get_key(), entity)
         self.cache.touch(entity.get_key(), entity.get_ttl())
+        self.metrics.track_entry(entity_model_of(meta), entity.get_key(), entity.get_ttl())
+        self._remove_negative_entry(entity.get_key())
+        if entity.is_dirty:
+            self._mark_dirty(meta, entity)
         return True
 
     def get(self, meta: Any, key: str) -> Optional[CacheableEntity]:
+        entity_model = entity_model_of(meta)
         entity = self.cache.get(key)
         if entity is None:
-            entity = self.repository.find_by_key(meta, key)
-            if entity is None:
+            if self.metrics.untrack_entry(key) is not None:
+                # The entry was put but the cache no longer holds it: expired or culled
+                self.metrics.increment(entity_model, "evictions")
+            if self._has_negative_entry(key):
+                self.metrics.increment(entity_model, "negative_hits")
                 return None
-            self.put(meta, entity)
-        return self.cache.get(key)
+            self.metrics.increment(entity_model, "misses")
+            if self._load(meta, key) is None:
+                return None
+            return self.cache.get(key)
+        self.metrics.increment(entity_model, "hits")
+        return entity
 
     def remove(self, key: str) -> bool:
+        self.metrics.untrack_entry(key)
         return self.cache.delete(key)
 
     def clear(self) -> None:
@@ -59,27 +96,84 @@ class PersistentCachingService(CachingService):
         return self.get(meta, key) is not None
 
     def invalidate(self, meta: Any, keys: List[str]) -> bool:
+        entity_model = entity_model_of(meta)
         self.cache.delete_many(keys)
-        entities = self.repository.find_all_by_key(meta, keys)
+        with self._dirty_lock:
+            for key in keys:
+                self._dirty.pop(key, None)
+                self._flush_failures.pop(key, None)
+                self.metrics.untrack_entry(key)
+        self.metrics.increment(entity_model, "invalidations", len(keys))
+        with self.metrics.timed(entity_model, "find_all_by_key"):
+            entities = self.repository.find_all_by_key(meta, keys)
         if entities is not None:
             for entity in entities:
                 entity.expiration = now()
-        self.repository.update_all(meta, entities)
+        with self.metrics.timed(entity_model, "update_all"):
+            self.repository.update_all(meta, entities)
+        # Invalidated entities no longer match the lookup condition, so they are known misses
+        for key in keys:
+            self._put_negative_entry(key)
         return True
 
     def invalidate_all(self) -> None:
         self.clear()
 
     def write_back(self, meta, entities: List[CacheableEntity]) -> bool:
-        for entity in entities:
-            if entity.is_dirty:
-                entity.is_dirty = False
-                self.repository.save_all(meta, entities)
+        self._write_back(meta, entities)
         return True
 
+    def _write_back(self, meta, entities: List[CacheableEntity]) -> int:
+        """
+        Writes dirty entities in at most two repository calls: one bulk save for entities
+        without a technical_id and one bulk update for the rest. Returns the number of round trips.
+        Updates use the save_transition of the meta, its update_transition invalidates the entities.
+        """
+        dirty_entities = [entity for entity in entities if entity.is_dirty]
+        if not dirty_entities:
+            return 0
+        new_entities = [entity for entity in dirty_entities if getattr(entity, "technical_id", None) is None]
+        existing_entities = [entity for entity in dirty_entities if getattr(entity, "technical_id", None) is not None]
+
+        entity_model = entity_model_of(meta)
+        round_trips = 0
+        for entity in dirty_entities:
+            entity.is_dirty = False
+        try:
+            if new_entities:
+                with self.metrics.timed(entity_model, "save_all"):
+                    self.repository.save_all(meta, new_entities)
+                round_trips += 1
+            if existing_entities:
+                with self.metrics.timed(entity_model, "update_all"):
+                    self.repository.update_all(dict(meta, update_transition=meta["save_transition"]),
+                                               existing_entities)
+                round_trips += 1
+        except Exception:
+            for entity in dirty_entities:
+                entity.is_dirty = True
+            raise
+        logger.info(f"Wrote back {len(new_entities)} new and {len(existing_entities)} existing "
+                    f"'{meta['entity_model']}' entities in {round_trips} round trips")
+        self.metrics.increment(entity_model, "write_back_batches")
+        self.metrics.increment(entity_model, "write_back_round_trips", round_trips)
+        self.metrics.increment(entity_model, "written_entities", len(dirty_entities))
+        self._after_write_back(dirty_entities)
+        return round_trips
+
     def flush_dirty_entries(self, meta) -> None:
-        dirty_entities = [entity for entity in self.cache.values() if entity.is_dirty]
-        self.write_back(meta, dirty_entities)
+        """
+        Writes back all entities marked dirty by put. The meta of the latest put of each key is used,
+        the meta argument is kept for interface compatibility.
+        """
+        # Bounded by the current backlog, so entries requeued after a failed write wait for the next flush
+        with self._dirty_lock:
+            remaining = len(self._dirty)
+        while remaining > 0:
+            flushed = self._flush_batch(min(CACHE_FLUSH_BATCH_SIZE, remaining))
+            if flushed == 0:
+                break
+            remaining -= flushed
 
     def refresh(self, meta: Any, key: str) -> bool:
         entity = self.get(meta, key)
@@ -88,3 +182,204 @@ class PersistentCachingService(CachingService):
             entity.is_dirty = False
             return True
         return False
+
+    def _load(self, meta: Any, key: str) -> Optional[CacheableEntity]:
+        """
+        Loads a missing key from the repository. Only one lookup per key is in flight,
+        concurrent callers wait up to CACHE_LOAD_TIMEOUT seconds for its result.
+        """
+        with self._in_flight_lock:
+            load = self._in_flight.get(key)
+            is_leader = load is None
+            if is_leader:
+                load = _InFlightLoad()
+                self._in_flight[key] = load
+
+        if not is_leader:
+            self.metrics.increment(entity_model_of(meta), "coalesced_loads")
+            if not load.done.wait(CACHE_LOAD_TIMEOUT):
+                raise TimeoutError(f"Timeout exceeded after {CACHE_LOAD_TIMEOUT} seconds waiting for key '{key}'")
+            if load.error is not None:
+                raise load.error
+            return load.entity
+
+        try:
+            with self.metrics.timed(entity_model_of(meta), "find_by_key"):
+                entity = self.repository.find_by_key(meta, key)
+            if entity is None:
+                self._put_negative_entry(key)
+            else:
+                entity.is_dirty = False
+                self.put(meta, entity)
+            load.entity = entity
+            return entity
+        except Exception as e:
+            load.error = e
+            raise
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.pop(key, None)
+            load.done.set()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        dirty_counts = {}
+        with self._dirty_lock:
+            for meta, entity in self._dirty.values():
+                entity_model = entity_model_of(meta)
+                dirty_counts[entity_model] = dirty_counts.get(entity_model, 0) + 1
+        gauges = {entity_model: {"dirty": count} for entity_model, count in dirty_counts.items()}
+        return self.metrics.snapshot(gauges)
+
+    def inspect(self, key: str) -> Optional[Dict[str, Any]]:
+        info = self.metrics.inspect(key, self.cache.get(key))
+        if info is not None:
+            with self._dirty_lock:
+                info["pending_write_back"] = key in self._dirty
+        return info
+
+    # Negative entries remember keys that were not found in the repository,
+    # so repeated lookups of nonexistent keys don't trigger a new search each time
+    @staticmethod
+    def _negative_key(key: str) -> str:
+        return f"{NEGATIVE_ENTRY_PREFIX}{key}"
+
+    def _has_negative_entry(self, key: str) -> bool:
+        return self.cache.get(self._negative_key(key)) is not None
+
+    def _put_negative_entry(self, key: str) -> None:
+        if CACHE_NEGATIVE_TTL > 0:
+            self.cache.set(self._negative_key(key), True, CACHE_NEGATIVE_TTL)
+
+    def _remove_negative_entry(self, key: str) -> None:
+        self.cache.delete(self._negative_key(key))
+
+    # Dirty index: key -> (meta, entity) of the latest put, flushed in batches by a background thread
+    def _init_write_back_flusher(self):
+        self._dirty = OrderedDict()
+        self._dirty_lock = threading.Lock()
+        # key -> consecutive failed flushes of its pending entry
+        self._flush_failures = {}
+        self._flush_stop = threading.Event()
+        self._flush_thread = None
+        if self.repository is None or CACHE_FLUSH_INTERVAL <= 0:
+            return
+        self._flush_thread = threading.Thread(target=self._flush_loop, name="cache-write-back-flusher", daemon=True)
+        self._flush_thread.start()
+        atexit.register(self.shutdown)
+
+    def _mark_dirty(self, meta, entity: CacheableEntity) -> None:
+        with self._dirty_lock:
+            # Coalesce repeated updates of the same key, keeping the latest entity
+            self._dirty.pop(entity.get_key(), None)
+            self._dirty[entity.get_key()] = (meta, entity)
+            self._flush_failures.pop(entity.get_key(), None)
+
+    @staticmethod
+    def _same_state(entity: Any, other: Any) -> bool:
+        """Compares the entity data, ignoring the write-back bookkeeping (technical_id and is_dirty)."""
+        ignored = ("technical_id", "is_dirty")
+        return ({name: value for name, value in vars(entity).items() if name not in ignored} ==
+                {name: value for name, value in vars(other).items() if name not in ignored})
+
+    def _after_write_back(self, entities: List[CacheableEntity]) -> None:
+        """
+        Matches pending and cached entries of the written entities by key, as callers usually write back
+        a copy returned by get. A pending entry holding the written state is dropped, a newer one is kept.
+        The assigned technical_id is carried over to both, so later writes of the key update the entity
+        instead of saving a new one.
+        """
+        with self._dirty_lock:
+            for entity in entities:
+                key = entity.get_key()
+                technical_id = getattr(entity, "technical_id", None)
+                self._flush_failures.pop(key, None)
+                dirty_entry = self._dirty.get(key)
+                if dirty_entry is not None:
+                    pending = dirty_entry[1]
+                    if pending is entity or self._same_state(pending, entity):
+                        del self._dirty[key]
+                    elif technical_id is not None and getattr(pending, "technical_id", None) is None:
+                        pending.technical_id = technical_id
+                cached = self.cache.get(key)
+                if cached is None:
+                    continue
+                if technical_id is not None and getattr(cached, "technical_id", None) is None:
+                    cached.technical_id = technical_id
+                if key not in self._dirty and self._same_state(cached, entity):
+                    cached.is_dirty = False
+                self.cache.set(key, cached)
+                self.cache.touch(key, cached.get_ttl())
+
+    def _flush_batch(self, batch_size: int) -> int:
+        with self._dirty_lock:
+            batch = []
+            while self._dirty and len(batch) < batch_size:
+                batch.append(self._dirty.popitem(last=False))
+        if not batch:
+            return 0
+
+        groups = {}
+        for key, (meta, entity) in batch:
+            group_key = (meta["entity_model"], meta["entity_version"], meta["token"])
+            groups.setdefault(group_key, (meta, []))[1].append(entity)
+
+        round_trips = 0
+        for meta, entities in groups.values():
+            try:
+                round_trips += self._write_back(meta, entities)
+            except Exception as e:
+                if self._is_auth_error(e):
+                    # The token stored with the entries is expired or revoked, retrying can't succeed
+                    logger.error(f"Dropping {len(entities)} dirty '{meta['entity_model']}' entities, "
+                                 f"write-back was not authorized: {e}")
+                    self._drop_dirty(meta, entities)
+                    continue
+                logger.error(f"Error flushing {len(entities)} dirty '{meta['entity_model']}' entities: {e}")
+                self._requeue_dirty(meta, entities)
+        logger.info(f"Flushed {len(batch)} dirty cache entities in {round_trips} round trips")
+        return len(batch)
+
+    def _requeue_dirty(self, meta, entities: List[CacheableEntity]) -> None:
+        """Requeues entities of a failed flush, up to CACHE_FLUSH_MAX_RETRIES consecutive failures per key."""
+        with self._dirty_lock:
+            for entity in entities:
+                key = entity.get_key()
+                entity.is_dirty = True
+                # A newer put of the same key supersedes the failed one
+                if key in self._dirty:
+                    continue
+                failures = self._flush_failures.get(key, 0) + 1
+                if failures > CACHE_FLUSH_MAX_RETRIES:
+                    logger.error(f"Dropping dirty cache entity '{key}' after {CACHE_FLUSH_MAX_RETRIES} failed retries")
+                    self._flush_failures.pop(key, None)
+                    self.metrics.increment(entity_model_of(meta), "dropped_writes")
+                    continue
+                self._flush_failures[key] = failures
+                self._dirty[key] = (meta, entity)
+
+    def _drop_dirty(self, meta, entities: List[CacheableEntity]) -> None:
+        with self._dirty_lock:
+            for entity in entities:
+                self._flush_failures.pop(entity.get_key(), None)
+        self.metrics.increment(entity_model_of(meta), "dropped_writes", len(entities))
+
+    @staticmethod
+    def _is_auth_error(error: Exception) -> bool:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+        return status_code in (401, 403)
+
+    def _flush_loop(self):
+        while not self._flush_stop.wait(CACHE_FLUSH_INTERVAL):
+            try:
+                self.flush_dirty_entries(None)
+            except Exception as e:
+                logger.error(f"Error in cache write-back flusher: {e}")
+                logger.exception("An exception occurred")
+
+    def shutdown(self):
+        self._flush_stop.set()
+        if self._flush_thread is not None:
+            self._flush_thread.join(timeout=CACHE_FLUSH_INTERVAL)
+        if CACHE_FLUSH_DRAIN_ON_SHUTDOWN.lower() == "true":
+            logger.info(f"Draining {len(self._dirty)} dirty cache entities on shutdown")
+            self.flush_dirty_entries(None)
@@ -1,8 +1,9 @@
 from dataclasses import dataclass, asdict, field
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
-from common_utils.config import CYODA_ENTITY_VERSION
+from common_utils.config import (CYODA_ENTITY_VERSION, CYODA_CHAT_HISTORY_ENTITY_VERSION, CHAT_HISTORY_SEGMENT_SIZE,
+                                 CYODA_SAVE_TRANSITION)
 from common_utils.utils import now, timestamp_before, expiration_date
 from middleware.entity.cacheable_entity import CacheableEntity
 from middleware.entity.cyoda_entity import CyodaEntity
@@ -30,6 +31,8 @@ class ChatHistoryEntity(CacheableEntity, CyodaEntity):
     messages: List[ChatHistoryMessage]
     is_dirty: bool
     expiration: Any = expiration_date(31536000)
+    # Number of sealed segments, messages holds only the tail after them
+    segments: int = 0
 
     def to_dict(self) -> Dict[str, Any]:
         return asdict(self)
@@ -49,7 +52,8 @@ class ChatHistoryEntity(CacheableEntity, CyodaEntity):
                 )
                 for msg in data.get('messages', [])
             ],
-            is_dirty=data.get('is_dirty', True)
+            is_dirty=data.get('is_dirty', True),
+            segments=data.get('segments', None) or 0
         )
         entity.technical_id = data.get('technical_id', None)
         return entity
@@ -64,10 +68,37 @@ class ChatHistoryEntity(CacheableEntity, CyodaEntity):
     def add_message(self, chat_history_message: ChatHistoryMessage):
         self.messages.append(chat_history_message)
 
+    def seal_segment(self) -> Optional['ChatHistoryEntity']:
+        """
+        Moves a full tail into a new segment entity, so saving a turn only rewrites this entity's short tail.
+        Returns the segment to persist, or None while the tail is below CHAT_HISTORY_SEGMENT_SIZE.
+        """
+        if len(self.messages) < CHAT_HISTORY_SEGMENT_SIZE:
+            return None
+        segment = ChatHistoryEntity(
+            key=self.generate_segment_key(self.key, self.segments),
+            date=self.date,
+            timestamp=self.timestamp,
+            messages=self.messages[:CHAT_HISTORY_SEGMENT_SIZE],
+            is_dirty=True,
+            expiration=self.expiration
+        )
+        self.messages = self.messages[CHAT_HISTORY_SEGMENT_SIZE:]
+        self.segments += 1
+        self.is_dirty = True
+        return segment
+
+    def get_segment_keys(self) -> List[str]:
+        return [self.generate_segment_key(self.key, index) for index in range(self.segments)]
+
     @staticmethod
     def generate_key(key: str):
         return f"{chat_history_entity_prefix}_{key}"
 
+    @staticmethod
+    def generate_segment_key(key: str, index: int):
+        return f"{key}_segment_{index}"
+
     @staticmethod
     def dummy():
         return ChatHistoryEntity(key="", date="", timestamp=0, messages=[], is_dirty=True)
@@ -114,8 +145,12 @@ class ChatHistoryEntity(CacheableEntity, CyodaEntity):
 
     def get_cyoda_meta(self):
         return {"entity_model": CHAT_HISTORY_ENTITY,
-                "entity_version": CYODA_ENTITY_VERSION,
-                "update_transition": "invalidate"}
+                "entity_version": CYODA_CHAT_HISTORY_ENTITY_VERSION,
+                "update_transition": "invalidate",
+                "save_transition": CYODA_SAVE_TRANSITION,
+                # Histories saved before segments were added, read until they are saved again
+                "previous_entity_version": CYODA_ENTITY_VERSION
+                if CYODA_ENTITY_VERSION != CYODA_CHAT_HISTORY_ENTITY_VERSION else None}
 
     def get_meta(self):
         meta = {}
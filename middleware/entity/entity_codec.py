@@ -0,0 +1,58 @@
+from dataclasses import fields, is_dataclass
+from typing import Any, List
+
+from middleware.entity.entity_factory import base_entity_from_dict
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - the standard json module is the fallback backend
+    orjson = None
+    import json
+
+
+def dumps(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _to_plain(value: Any) -> Any:
+    if is_dataclass(value):
+        return {field.name: _to_plain(getattr(value, field.name)) for field in fields(value)}
+    if isinstance(value, list):
+        return [_to_plain(item) for item in value]
+    return value
+
+
+def entity_to_payload(entity) -> dict:
+    """
+    Builds the Cyoda payload of an entity: fields that are not None, without technical_id.
+    Unlike dataclasses.asdict, plain values are not deep-copied, only nested dataclasses are converted.
+    """
+    payload = {}
+    for field in fields(entity):
+        if not field.metadata.get("include_in_dict", True):
+            continue
+        value = getattr(entity, field.name)
+        if value is not None:
+            payload[field.name] = _to_plain(value)
+    return payload
+
+
+def encode_entity(entity) -> bytes:
+    return dumps(entity_to_payload(entity))
+
+
+def encode_entities(entities: List[Any]) -> bytes:
+    return dumps([entity_to_payload(entity) for entity in entities])
+
+
+def decode_entities(entity_model: str, data) -> List[Any]:
+    """Decodes a JSON array of entity trees straight into entities of the given model."""
+    return [base_entity_from_dict(entity_model, tree) for tree in loads(data)]
@@ -1,11 +1,18 @@
 from middleware.entity.cache_entity import CACHE_ENTITY, CacheEntity
 from middleware.entity.chat_history_entity import CHAT_HISTORY_ENTITY, ChatHistoryEntity
 
+ENTITY_CLASSES = {
+    CACHE_ENTITY: CacheEntity,
+    CHAT_HISTORY_ENTITY: ChatHistoryEntity,
+}
+
+
+def is_entity_registered(entity_model):
+    return entity_model in ENTITY_CLASSES
+
 
 def base_entity_from_dict(entity_model, data):
-    if entity_model == CACHE_ENTITY:
-        return CacheEntity.from_dict(data)
-    elif entity_model == CHAT_HISTORY_ENTITY:
-        return ChatHistoryEntity.from_dict(data)
+    if entity_model in ENTITY_CLASSES:
+        return ENTITY_CLASSES[entity_model].from_dict(data)
     else:
-        raise Exception("no entity registered")
\ No newline at end of file
+        raise Exception("no entity registered")
@@ -0,0 +1,96 @@
+import logging
+from typing import Any, Optional
+
+from cloudevents_pb2 import CloudEvent
+from common_utils import config
+from middleware.entity.entity_codec import dumps, loads
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack payloads fall back to binary JSON
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE_ATTRIBUTE = "datacontenttype"
+# Extension attribute announcing the content types a peer decodes, sent on the join and greet events
+ACCEPT_ATTRIBUTE = "acceptcontenttypes"
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+ENCODING_CONTENT_TYPES = {
+    "json": JSON_CONTENT_TYPE,
+    "msgpack": MSGPACK_CONTENT_TYPE,
+}
+
+
+def supported_content_types() -> list:
+    return [JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE] if msgpack is not None else [JSON_CONTENT_TYPE]
+
+
+def get_accepted_content_types(event: CloudEvent) -> tuple:
+    """Content types the event's sender announced it decodes, of those this member supports."""
+    attribute = event.attributes.get(ACCEPT_ATTRIBUTE)
+    if attribute is None or not attribute.ce_string:
+        return ()
+    announced = {content_type.strip() for content_type in attribute.ce_string.split(",")}
+    return tuple(content_type for content_type in supported_content_types() if content_type in announced)
+
+
+def get_content_type(event: CloudEvent) -> Optional[str]:
+    """Content type of a binary_data event, None for text_data (always JSON)."""
+    if event.WhichOneof("data") != "binary_data":
+        return None
+    attribute = event.attributes.get(CONTENT_TYPE_ATTRIBUTE)
+    return attribute.ce_string if attribute is not None and attribute.ce_string else JSON_CONTENT_TYPE
+
+
+def decode_event_data(event: CloudEvent) -> Any:
+    data_field = event.WhichOneof("data")
+    if data_field == "text_data":
+        return loads(event.text_data)
+    if data_field == "binary_data":
+        if get_content_type(event) == MSGPACK_CONTENT_TYPE:
+            if msgpack is None:
+                raise ValueError("Received a msgpack payload but msgpack is not installed")
+            return msgpack.unpackb(event.binary_data, raw=False)
+        return loads(event.binary_data)
+    return {}
+
+
+def _binary_content_type(reply_to: Optional[str], peer_content_types) -> Optional[str]:
+    # A peer which sent a binary payload decodes that content type, replies use it regardless of size
+    if reply_to is not None:
+        return reply_to if reply_to in supported_content_types() else JSON_CONTENT_TYPE
+    content_type = ENCODING_CONTENT_TYPES.get(config.CYODA_GRPC_PAYLOAD_ENCODING.lower())
+    if content_type == MSGPACK_CONTENT_TYPE and msgpack is None:
+        content_type = JSON_CONTENT_TYPE
+    # Other events only go binary to a peer which announced it decodes the content type
+    return content_type if content_type in peer_content_types else None
+
+
+def encode_event_data(event: CloudEvent, data: Any, reply_to: Optional[str] = None,
+                      peer_content_types=()) -> CloudEvent:
+    """
+    Sets the event data. Payloads go as JSON text_data, except:
+    replies to a binary event (reply_to is that event's content type) use its content type, and payloads of
+    at least GRPC_BINARY_PAYLOAD_THRESHOLD bytes use the GRPC_PAYLOAD_ENCODING ('json' or 'msgpack')
+    if it is among the peer_content_types the peer announced.
+    """
+    content_type = _binary_content_type(reply_to, peer_content_types)
+    if content_type == MSGPACK_CONTENT_TYPE:
+        encoded = msgpack.packb(data, use_bin_type=True)
+        if reply_to is not None or len(encoded) >= config.CYODA_GRPC_BINARY_PAYLOAD_THRESHOLD:
+            event.binary_data = encoded
+            event.attributes[CONTENT_TYPE_ATTRIBUTE].ce_string = MSGPACK_CONTENT_TYPE
+            return event
+        encoded = dumps(data)
+    else:
+        encoded = dumps(data)
+        if content_type is not None and (reply_to is not None
+                                         or len(encoded) >= config.CYODA_GRPC_BINARY_PAYLOAD_THRESHOLD):
+            event.binary_data = encoded
+            event.attributes[CONTENT_TYPE_ATTRIBUTE].ce_string = JSON_CONTENT_TYPE
+            return event
+    event.text_data = encoded.decode("utf-8")
+    return event
@@ -1,14 +1,23 @@
 import logging
+import random
+import time
 
 import grpc
 import uuid
-import json
 import asyncio
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Optional
 from cloudevents_pb2 import CloudEvent
 from common_utils import config
 from common_utils.config import CYODA_GRPC_PROCESSOR_TAG
 from cyoda_cloud_api_pb2_grpc import CloudEventsServiceStub
-from middleware.repository.cyoda.entity.workflow import process_dispatch, process_event
+from middleware._auth.auth import get_service_token, TokenProvider
+from middleware.grpc_client.event_codec import (encode_event_data, decode_event_data, get_content_type,
+                                                 get_accepted_content_types, supported_content_types,
+                                                 ACCEPT_ATTRIBUTE)
+from middleware.grpc_client.grpc_metrics import GrpcMetrics
+from middleware.repository.cyoda.entity.processor_registry import CircuitOpenError
+from middleware.repository.cyoda.entity.workflow import process_event, processor_registry
 
 # These tags are configured in the workflow UI for external processor
 TAGS = [CYODA_GRPC_PROCESSOR_TAG]
@@ -26,8 +35,12 @@ EVENT_ID_FORMAT = "{uuid}"
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_thread_executor = None
+_process_executor = None
 
-def create_cloud_event(event_id: str, source: str, event_type: str, data: dict) -> CloudEvent:
+
+def create_cloud_event(event_id: str, source: str, event_type: str, data: dict,
+                       reply_to: Optional[str] = None, peer_content_types=()) -> CloudEvent:
     """
     Create a CloudEvent instance with the given parameters.
 
@@ -35,15 +48,17 @@ def create_cloud_event(event_id: str, source: str, event_type: str, data: dict)
     :param source: Source of the event.
     :param event_type: Type of the event.
     :param data: Data associated with the event.
+    :param reply_to: Content type of the binary event this one responds to, None for text events.
+    :param peer_content_types: Binary content types the server announced in its greet event.
     :return: A CloudEvent instance.
     """
-    return CloudEvent(
+    event = CloudEvent(
         id=event_id,
         source=source,
         spec_version=SPEC_VERSION,
-        type=event_type,
-        text_data=json.dumps(data)
+        type=event_type
     )
+    return encode_event_data(event, data, reply_to, peer_content_types)
 
 
 def create_join_event() -> CloudEvent:
@@ -52,19 +67,26 @@ def create_join_event() -> CloudEvent:
 
     :return: A CloudEvent instance for the join event.
     """
-    return create_cloud_event(
+    event = create_cloud_event(
         event_id=str(uuid.uuid4()),
         source=SOURCE,
         event_type=JOIN_EVENT_TYPE,
         data={"owner": OWNER, "tags": TAGS}
     )
+    # Lets the server send binary payloads in the content types this member decodes
+    event.attributes[ACCEPT_ATTRIBUTE].ce_string = ",".join(supported_content_types())
+    return event
 
 
-def create_notification_event(data: dict) -> CloudEvent:
+def create_notification_event(data: dict, success: bool = True, reply_to: Optional[str] = None,
+                              peer_content_types=()) -> CloudEvent:
     """
     Create a CloudEvent for a notification response.
 
     :param data: Data from the notification response.
+    :param success: Whether the processor completed.
+    :param reply_to: Content type of the calc request if it had a binary payload.
+    :param peer_content_types: Binary content types the server announced in its greet event.
     :return: A CloudEvent instance for the notification event.
     """
     return create_cloud_event(
@@ -76,12 +98,50 @@ def create_notification_event(data: dict) -> CloudEvent:
             "entityId": data.get('entityId'),
             "owner": OWNER,
             "payload": data.get('payload'),
-            "success": True
-        }
+            "success": success
+        },
+        reply_to=reply_to,
+        peer_content_types=peer_content_types
     )
 
 
-async def event_generator(queue: asyncio.Queue):
+class OutboundQueue(asyncio.Queue):
+    """
+    Queue of events to send on the stream, recording its depth and the time from receipt of an event
+    until its response is taken off the queue to be sent.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._metrics = GrpcMetrics()
+        self._received_at = {}
+        # Binary content types the server of this stream announced in its greet event
+        self.peer_content_types = ()
+        self._metrics.set_outbound_queue(self)
+
+    def put_nowait(self, item):
+        super().put_nowait(item)
+        self._metrics.record_outbound_queue_depth(self.qsize())
+
+    async def put_response(self, event: CloudEvent, metric_name: str, received_at: float):
+        """
+        Put a response event on the queue.
+
+        :param event: The response event.
+        :param metric_name: Name its latency is recorded under.
+        :param received_at: time.perf_counter() at receipt of the event it responds to.
+        """
+        self._received_at[event.id] = (metric_name, received_at)
+        await self.put(event)
+
+    def record_sent(self, event: CloudEvent):
+        timing = self._received_at.pop(event.id, None) if event is not None else None
+        if timing is not None:
+            metric_name, received_at = timing
+            self._metrics.record_latency(metric_name, (time.perf_counter() - received_at) * 1000.0)
+
+
+async def event_generator(queue: OutboundQueue):
     """
     Generate and yield events including initial and follow-up events.
 
@@ -94,35 +154,89 @@ async def event_generator(queue: asyncio.Queue):
         event = await queue.get()
         if event is None:
             break
+        queue.record_sent(event)
         yield event
         queue.task_done()
 
 
+class ServiceTokenAuthMetadataPlugin(grpc.AuthMetadataPlugin):
+    """
+    Attaches the current service token to each call, so a reconnect never reuses an expired token.
+    """
+
+    def __call__(self, context, callback):
+        try:
+            callback((("authorization", f"Bearer {get_service_token()}"),), None)
+        except Exception as e:
+            callback((), e)
+
+
 # Utility function to set up gRPC credentials
-def get_grpc_credentials(token: str):
+def get_grpc_credentials():
     """
-    Create gRPC credentials using the provided token.
+    Create gRPC credentials backed by the shared service token provider.
 
-    :param token: Authentication token for the gRPC service.
     :return: Composite credentials for secure gRPC communication.
     """
-    auth_creds = grpc.access_token_call_credentials(token)
+    auth_creds = grpc.metadata_call_credentials(ServiceTokenAuthMetadataPlugin())
     return grpc.composite_channel_credentials(grpc.ssl_channel_credentials(), auth_creds)
 
 
+def get_channel_options():
+    """
+    Channel options for keepalive pings and message size limits, from the GRPC_* settings.
+
+    :return: List of gRPC channel options.
+    """
+    return [
+        ("grpc.keepalive_time_ms", config.CYODA_GRPC_KEEPALIVE_TIME_MS),
+        ("grpc.keepalive_timeout_ms", config.CYODA_GRPC_KEEPALIVE_TIMEOUT_MS),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.max_pings_without_data", 0),
+        ("grpc.max_send_message_length", config.CYODA_GRPC_MAX_MESSAGE_SIZE),
+        ("grpc.max_receive_message_length", config.CYODA_GRPC_MAX_MESSAGE_SIZE),
+    ]
+
+
+def get_channel_compression():
+    """
+    Channel compression from GRPC_COMPRESSION.
+
+    :return: The grpc.Compression algorithm.
+    """
+    return {
+        "gzip": grpc.Compression.Gzip,
+        "deflate": grpc.Compression.Deflate,
+    }.get(config.CYODA_GRPC_COMPRESSION.lower(), grpc.Compression.NoCompression)
+
+
+def get_reconnect_delay(attempt: int) -> float:
+    """
+    Exponential backoff with full jitter, so members don't reconnect in lockstep after a Cyoda restart.
+
+    :param attempt: Number of consecutive failed attempts before this one.
+    :return: Delay in seconds.
+    """
+    max_delay = min(config.CYODA_GRPC_RECONNECT_MAX_DELAY,
+                    config.CYODA_GRPC_RECONNECT_BASE_DELAY * (2 ** min(attempt, 30)))
+    return random.uniform(0, max_delay)
+
+
 # Function to handle greeting response
-def handle_greet_event():
+def handle_greet_event(response, queue: OutboundQueue):
     """
     Handle the GREET_EVENT_TYPE response.
 
     :param response: gRPC response containing the event details.
+    :param queue: Event queue of the stream, it keeps the content types the server announced.
     """
     logger.info("handle_greet_event:")
+    queue.peer_content_types = get_accepted_content_types(response)
 
 
-async def handle_keep_alive_event(response, queue: asyncio.Queue):
+async def handle_keep_alive_event(response, queue: OutboundQueue, received_at: float):
     logger.debug(f"handle_keep_alive_event: {response}")
-    data = json.loads(response.text_data)
+    data = decode_event_data(response)
     event = create_cloud_event(
         event_id=str(uuid.uuid4()),
         source=SOURCE,
@@ -132,84 +246,225 @@ async def handle_keep_alive_event(response, queue: asyncio.Queue):
             "owner": OWNER,
             "payload": None,
             "success": True
-        })
-    await queue.put(event)
+        },
+        reply_to=get_content_type(response),
+        peer_content_types=queue.peer_content_types)
+    await queue.put_response(event, f"ack.{KEEP_ALIVE_EVENT_TYPE}", received_at)
+
+
+def get_processor_executor(processor_name: str):
+    """
+    Return the executor for the given processor: a process pool for the processors listed in
+    GRPC_PROCESS_POOL_PROCESSORS, a thread pool otherwise. Both are bounded by GRPC_PROCESSOR_WORKERS.
+
+    :param processor_name: Name of the processor.
+    :return: The executor to run the processor in.
+    """
+    global _thread_executor, _process_executor
+    if processor_name in config.CYODA_GRPC_PROCESS_POOL_PROCESSORS:
+        if _process_executor is None:
+            _process_executor = ProcessPoolExecutor(max_workers=config.CYODA_GRPC_PROCESSOR_WORKERS)
+        return _process_executor
+    if _thread_executor is None:
+        _thread_executor = ThreadPoolExecutor(max_workers=config.CYODA_GRPC_PROCESSOR_WORKERS,
+                                              thread_name_prefix="grpc-processor")
+    return _thread_executor
+
+
+class CalcRequestDispatcher:
+    """
+    Runs calc requests concurrently off the event loop, so a slow processor doesn't hold up keep-alive acks
+    or other calc requests. Responses are put on the outbound queue as each request completes.
+    At most GRPC_PROCESSOR_WORKERS + GRPC_PROCESSOR_QUEUE_SIZE requests are accepted at a time, after that
+    submit waits, which stops reading the stream until a request completes.
+    """
+
+    def __init__(self, queue: OutboundQueue):
+        self._queue = queue
+        self._slots = asyncio.Semaphore(config.CYODA_GRPC_PROCESSOR_WORKERS + config.CYODA_GRPC_PROCESSOR_QUEUE_SIZE)
+        self._tasks = set()
+
+    async def submit(self, data: dict, received_at: float, content_type: Optional[str] = None):
+        await self._slots.acquire()
+        task = asyncio.create_task(self._run(data, received_at, content_type))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, data: dict, received_at: float, content_type: Optional[str]):
+        try:
+            await process_calc_req_event(data, self._queue, received_at, content_type)
+        except Exception as e:
+            logger.error(f"Error processing calc request {data.get('requestId')}: {e}")
+            logger.exception("An exception occurred")
+        finally:
+            self._slots.release()
+
+    def cancel(self):
+        """Cancel the pending requests, their responses can't be sent once the stream is closed."""
+        for task in list(self._tasks):
+            task.cancel()
 
 
 # Function to process notification data and create the notification event
-async def process_calc_req_event(token, data: dict, queue: asyncio.Queue):
+async def process_calc_req_event(data: dict, queue: OutboundQueue, received_at: float,
+                                 content_type: Optional[str] = None):
     """
-    Process notification data and create a notification event to be added to the event queue.
+    Process notification data in the processor's executor and create a notification event
+    to be added to the event queue.
 
     :param data: The notification data received from the response.
     :param queue: The asyncio queue for event processing.
+    :param received_at: time.perf_counter() at receipt of the calc request.
+    :param content_type: Content type of the calc request if it had a binary payload.
     """
+    metrics = GrpcMetrics()
     processor_name = data.get('processorName')
+    success = True
 
     try:
         # Process the first or subsequent versions of the entity
-        if processor_name in process_dispatch:
+        if processor_registry.is_registered(processor_name):
             logger.info(f"Processing notification data: {data}")
-            process_event(token, data, processor_name)
-
+            # Processors call Cyoda with the current service token, not the one the stream started with.
+            # A due refresh logs in, which must not block the event loop
+            token = await asyncio.to_thread(get_service_token)
+            with metrics.timed(f"process.{processor_name}"):
+                await processor_registry.get(processor_name).execute(get_processor_executor(processor_name),
+                                                                     process_event, token, data, processor_name)
+
+    except CircuitOpenError as e:
+        success = False
+        metrics.increment(f"rejected.processor.{processor_name}")
+        logger.warning(e)
+    except asyncio.TimeoutError:
+        success = False
+        metrics.increment(f"timeouts.processor.{processor_name}")
+        logger.error(f"Processor {processor_name} timed out on request {data.get('requestId')}")
     except Exception as e:
+        success = False
+        metrics.increment(f"errors.processor.{processor_name}")
         logger.error(e)
     #Create notification event and put it in the queue
-    notification_event = create_notification_event(data)
-    await queue.put(notification_event)
+    notification_event = create_notification_event(data, success, content_type, queue.peer_content_types)
+    await queue.put_response(notification_event, f"{CALC_REQ_EVENT_TYPE}.{processor_name}", received_at)
 
 
 # Function to handle finish_workflow processor
-async def handle_finish_workflow(data: dict, queue: asyncio.Queue):
+async def handle_finish_workflow(data: dict, queue: OutboundQueue, received_at: float,
+                                 content_type: Optional[str] = None):
     """
     Handle the 'finish_workflow' processorName and signal the end of the stream.
 
     :param data: Data from the response.
     :param queue: Event queue to place the notification event and signal end of stream.
     """
-    notification_event = create_notification_event(data)
-    await queue.put(notification_event)
+    notification_event = create_notification_event(data, reply_to=content_type,
+                                                   peer_content_types=queue.peer_content_types)
+    await queue.put_response(notification_event, f"{CALC_REQ_EVENT_TYPE}.finish_workflow", received_at)
     # await queue.put(None)  # Signal the end of the stream
 
 
 # Main function to consume the gRPC stream
-async def consume_stream(token):
+def create_channel(target: Optional[str] = None, secure: bool = True) -> grpc.aio.Channel:
     """
-    Handle bi-directional streaming with response-driven event generation.
-    """
-    credentials = get_grpc_credentials(token)
-    queue = asyncio.Queue()
+    Create the channel to the CloudEventsService.
 
-    async with grpc.aio.secure_channel(config.CYODA_GRPC_ADDRESS, credentials) as channel:
-        stub = CloudEventsServiceStub(channel)
-        call = stub.startStreaming(event_generator(queue))
+    :param target: Address to connect to, CYODA_GRPC_ADDRESS by default.
+    :param secure: False for a plaintext channel without credentials, e.g. to a local stand-in server.
+    :return: The gRPC channel.
+    """
+    target = target or config.CYODA_GRPC_ADDRESS
+    if not secure:
+        return grpc.aio.insecure_channel(target, options=get_channel_options(),
+                                         compression=get_channel_compression())
+    return grpc.aio.secure_channel(target, get_grpc_credentials(), options=get_channel_options(),
+                                   compression=get_channel_compression())
 
-        async for response in call:
-            logger.info(f"Received response: {response}")
 
-            if response.type == GREET_EVENT_TYPE:
-                handle_greet_event()
-            elif response.type == KEEP_ALIVE_EVENT_TYPE:
-                await handle_keep_alive_event(response, queue)
-            elif response.type == CALC_REQ_EVENT_TYPE:
-                logger.info(f"Received calc request: {response}")
-                # Parse response data
-                data = json.loads(response.text_data)
-                processor_name = data.get('processorName')
+async def consume_stream(target: Optional[str] = None, secure: bool = True):
+    """
+    Handle bi-directional streaming with response-driven event generation.
 
-                if processor_name in process_dispatch:
-                    await process_calc_req_event(token, data, queue)
-                elif processor_name == "finish_workflow":
-                    await handle_finish_workflow(data, queue)
-            else:
-                logger.debug(response)
+    :param target: Address to connect to, CYODA_GRPC_ADDRESS by default.
+    :param secure: False for a plaintext channel without credentials.
+    """
+    queue = OutboundQueue()
+    dispatcher = CalcRequestDispatcher(queue)
 
+    async with create_channel(target, secure) as channel:
+        stub = CloudEventsServiceStub(channel)
+        call = stub.startStreaming(event_generator(queue))
 
-async def grpc_stream(token):
+        try:
+            await _read_stream(call, queue, dispatcher)
+        finally:
+            dispatcher.cancel()
+
+
+async def _read_stream(call, queue: OutboundQueue, dispatcher: CalcRequestDispatcher):
+    metrics = GrpcMetrics()
+    async for response in call:
+        received_at = time.perf_counter()
+        logger.info(f"Received response: {response}")
+        metrics.record_connected()
+        metrics.increment(f"events.{response.type}")
+
+        if response.type == GREET_EVENT_TYPE:
+            handle_greet_event(response, queue)
+        elif response.type == KEEP_ALIVE_EVENT_TYPE:
+            await handle_keep_alive_event(response, queue, received_at)
+        elif response.type == CALC_REQ_EVENT_TYPE:
+            logger.info(f"Received calc request: {response}")
+            # Parse response data
+            data = decode_event_data(response)
+            content_type = get_content_type(response)
+            processor_name = data.get('processorName')
+
+            if processor_registry.is_registered(processor_name):
+                await dispatcher.submit(data, received_at, content_type)
+            elif processor_name == "finish_workflow":
+                await handle_finish_workflow(data, queue, received_at, content_type)
+        else:
+            logger.debug(response)
+
+
+async def grpc_stream():
+    """
+    Keep the stream open, reconnecting with jittered exponential backoff. Every attempt authenticates with
+    the current service token; a rejected token is dropped so the next attempt logs in again.
+    """
+    metrics = GrpcMetrics()
+    attempt = 0
     try:
         while True:
-            await consume_stream(token)
-            logger.info("Working...")
+            error = None
+            try:
+                token = await asyncio.to_thread(get_service_token)
+                if token is None:
+                    raise Exception("No service token available")
+                await consume_stream()
+                logger.info("gRPC stream closed by the server")
+            except grpc.aio.AioRpcError as e:
+                error = e.code().name
+                logger.error(f"gRPC stream failed: {e.code()} {e.details()}")
+                if e.code() == grpc.StatusCode.UNAUTHENTICATED:
+                    TokenProvider().invalidate()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = type(e).__name__
+                logger.error(f"gRPC stream failed: {e}")
+                logger.exception("An exception occurred")
+
+            connected_seconds = metrics.record_disconnected(error)
+            # A stream that stayed up longer than the longest backoff starts over with short delays
+            if connected_seconds is not None and connected_seconds > config.CYODA_GRPC_RECONNECT_MAX_DELAY:
+                attempt = 0
+            delay = get_reconnect_delay(attempt)
+            attempt += 1
+            logger.info(f"Reconnecting gRPC stream in {delay:.1f}s (attempt {attempt})")
+            await asyncio.sleep(delay)
+            metrics.record_reconnect_attempt()
     except asyncio.CancelledError:
         logger.info("consume_stream was cancelled")
         raise
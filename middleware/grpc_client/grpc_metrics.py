@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+
+class GrpcMetrics:
+    """
+    Thread-safe connection state, counters and latencies of the gRPC calc stream.
+    Latencies are measured from receipt of an event until its response is handed to the stream.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(GrpcMetrics, cls).__new__(cls)
+                    cls._instance._metrics_lock = threading.Lock()
+                    cls._instance._counters = defaultdict(int)
+                    cls._instance._connected_since = None
+                    cls._instance._disconnected_since = time.time()
+                    cls._instance._disconnected_seconds = 0.0
+                    cls._instance._last_error = None
+                    cls._instance._latencies = {}
+                    cls._instance._outbound_queue = None
+                    cls._instance._outbound_queue_max_depth = 0
+        return cls._instance
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._metrics_lock:
+            self._counters[name] += value
+
+    def record_latency(self, name: str, elapsed_ms: float) -> None:
+        with self._metrics_lock:
+            latency = self._latencies.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            latency["count"] += 1
+            latency["total_ms"] += elapsed_ms
+            latency["max_ms"] = max(latency["max_ms"], elapsed_ms)
+
+    @contextmanager
+    def timed(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_latency(name, (time.perf_counter() - start) * 1000.0)
+
+    def set_outbound_queue(self, queue) -> None:
+        with self._metrics_lock:
+            self._outbound_queue = queue
+
+    def record_outbound_queue_depth(self, depth: int) -> None:
+        with self._metrics_lock:
+            self._outbound_queue_max_depth = max(self._outbound_queue_max_depth, depth)
+
+    def record_connected(self) -> None:
+        with self._metrics_lock:
+            if self._connected_since is not None:
+                return
+            now = time.time()
+            self._connected_since = now
+            if self._disconnected_since is not None:
+                self._disconnected_seconds += now - self._disconnected_since
+                self._disconnected_since = None
+            self._counters["connects"] += 1
+
+    def record_disconnected(self, error: Optional[str] = None) -> Optional[float]:
+        """Returns how long the stream was connected, None if it never connected."""
+        with self._metrics_lock:
+            now = time.time()
+            connected_since, self._connected_since = self._connected_since, None
+            if self._disconnected_since is None:
+                self._disconnected_since = now
+            self._counters["disconnects"] += 1
+            if error is not None:
+                self._counters[f"errors.{error}"] += 1
+                self._last_error = error
+            return now - connected_since if connected_since is not None else None
+
+    def record_reconnect_attempt(self) -> None:
+        self.increment("reconnect_attempts")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            now = time.time()
+            disconnected_seconds = self._disconnected_seconds
+            if self._disconnected_since is not None:
+                disconnected_seconds += now - self._disconnected_since
+            return {
+                "connected": self._connected_since is not None,
+                "connected_seconds": now - self._connected_since if self._connected_since is not None else 0.0,
+                "disconnected_seconds_total": disconnected_seconds,
+                "last_error": self._last_error,
+                "counters": dict(self._counters),
+                "latencies": {
+                    name: dict(latency, avg_ms=latency["total_ms"] / latency["count"] if latency["count"] else 0.0)
+                    for name, latency in self._latencies.items()
+                },
+                "outbound_queue": {
+                    "depth": self._outbound_queue.qsize() if self._outbound_queue is not None else 0,
+                    "max_depth": self._outbound_queue_max_depth,
+                },
+            }
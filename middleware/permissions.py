@@ -0,0 +1,21 @@
+import hmac
+
+from rest_framework import permissions
+
+from common_utils import config
+
+METRICS_TOKEN_HEADER = "X-Metrics-Token"
+
+
+class IsMetricsOperator(permissions.BasePermission):
+    """
+    Allows requests carrying METRICS_ADMIN_TOKEN in the X-Metrics-Token header. The Authorization header
+    only proves an end user's token, which must not give access to other users' entries.
+    """
+    message = "Operator token required"
+
+    def has_permission(self, request, view):
+        token = request.headers.get(METRICS_TOKEN_HEADER)
+        if not config.METRICS_ADMIN_TOKEN or not token:
+            return False
+        return hmac.compare_digest(token.encode("utf-8"), config.METRICS_ADMIN_TOKEN.encode("utf-8"))
@@ -0,0 +1,86 @@
+from typing import Any
+
+
+def get_by_json_path(data: Any, json_path: str) -> Any:
+    """Resolves a simple dotted json path such as '$.key' or '$.meta.name' against a dict."""
+    value = data
+    for part in json_path.lstrip("$").strip(".").split("."):
+        if not part:
+            continue
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _compare(value: Any, operator_type: str, expected: Any) -> bool:
+    if operator_type == "EQUALS":
+        return value == expected
+    if operator_type == "NOT_EQUAL":
+        return value != expected
+    if operator_type == "IEQUALS":
+        return value is not None and expected is not None and str(value).lower() == str(expected).lower()
+    if operator_type == "IS_NULL":
+        return value is None
+    if operator_type == "NOT_NULL":
+        return value is not None
+    if operator_type == "CONTAINS":
+        return isinstance(value, (str, list, dict)) and expected in value
+    if value is None or expected is None:
+        return False
+    if operator_type == "GREATER_THAN":
+        return value > expected
+    if operator_type == "GREATER_OR_EQUAL":
+        return value >= expected
+    if operator_type == "LESS_THAN":
+        return value < expected
+    if operator_type == "LESS_OR_EQUAL":
+        return value <= expected
+    raise ValueError(f"Unsupported operator type: {operator_type}")
+
+
+def matches_condition(data: dict, condition: dict) -> bool:
+    """
+    Evaluates a Cyoda search condition (as built by get_by_id_condition) against an entity tree.
+    Supports nested 'group' conditions with AND/OR operators and 'simple' json path conditions.
+    """
+    condition_type = condition.get("type")
+    if condition_type == "group":
+        results = (matches_condition(data, nested) for nested in condition.get("conditions", []))
+        operator = condition.get("operator", "AND")
+        if operator == "AND":
+            return all(results)
+        if operator == "OR":
+            return any(results)
+        raise ValueError(f"Unsupported group operator: {operator}")
+    if condition_type == "simple":
+        value = get_by_json_path(data, condition["jsonPath"])
+        return _compare(value, condition["operatorType"], condition.get("value"))
+    raise ValueError(f"Unsupported condition type: {condition_type}")
+
+
+def build_multi_key_condition(condition: dict, keys: list) -> dict:
+    """
+    Turns a single key get_by_id_condition into a condition matching any of the keys:
+    the '$.key' EQUALS condition is replaced by an OR group of all keys, the other conditions are kept.
+    """
+    key_condition = {
+        "operator": "OR",
+        "conditions": [
+            {
+                "jsonPath": "$.key",
+                "operatorType": "EQUALS",
+                "value": key,
+                "type": "simple"
+            }
+            for key in keys
+        ],
+        "type": "group"
+    }
+    other_conditions = [nested for nested in condition.get("conditions", [])
+                        if nested.get("jsonPath") != "$.key"]
+    return {
+        "operator": "AND",
+        "conditions": other_conditions + [key_condition],
+        "type": "group"
+    }
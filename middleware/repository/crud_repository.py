@@ -8,6 +8,7 @@ from middleware.repository.repository import Repository
 
 class DBKeys(Enum):
     CYODA = "CYODA"
+    IN_MEMORY = "IN_MEMORY"
 
 class CrudRepository(Repository):
     """
@@ -80,7 +81,7 @@ class CrudRepository(Repository):
     @abstractmethod
     def find_by_key(self, meta, key: Any) -> Optional[BaseEntity]:
         """
-        Retrieves an entity by its key.
+        Retrieves an entity by its key, None if there is none. Raises if the lookup itself fails.
         """
         pass
 
@@ -0,0 +1,199 @@
+import asyncio
+import json
+import logging
+from typing import List, Any, Optional, AsyncIterator
+
+from common_utils.async_http import (send_get_request,
+                                     send_put_request,
+                                     send_post_request,
+                                     send_delete_request)
+from common_utils.config import API_URL
+from common_utils.utils import now
+from middleware.entity.entity import BaseEntity
+from middleware.entity.entity_codec import encode_entities, encode_entity, dumps, loads
+from middleware.entity.entity_factory import base_entity_from_dict, is_entity_registered
+from middleware.repository.conditions import build_multi_key_condition
+from middleware.repository.cyoda.cyoda_service import CyodaService, ALL_ENTITIES_CONDITION, SEARCH_PAGE_SIZE
+
+logger = logging.getLogger('django')
+
+
+class AsyncCyodaService:
+    """
+    Async counterpart of CyodaService for async views and the gRPC processor. Requests are sent over the
+    HTTP/2 client of the running event loop, so many concurrent calls share a single connection.
+    The technical id index and the transport independent checks are shared with CyodaService.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(AsyncCyodaService, cls).__new__(cls)
+            cls._instance.cyoda_service = CyodaService()
+        return cls._instance
+
+    async def find_by_key(self, meta, key: Any) -> Optional[BaseEntity]:
+        try:
+            entity = await self._get_by_known_technical_id(meta, key)
+            if entity is not None:
+                return entity
+            search_result = await self._search_by_condition(meta, meta["get_by_id_condition"])
+            if search_result is None:
+                raise Exception(f"Snapshot search for key '{key}' returned no snapshot")
+            if search_result.get('page').get('totalElements', 0) == 0:
+                return None
+            result_entities = CyodaService.convert_to_entities(search_result)
+            self.cyoda_service.index_technical_ids(meta, result_entities)
+            logger.info(f"Successfully retrieved entity for key '{key}'.")
+            return base_entity_from_dict(meta["entity_model"], result_entities[0])
+        except TimeoutError as te:
+            logger.error(f"Timeout while reading key '{key}': {te}")
+            raise
+        except Exception as e:
+            logger.error(f"Error reading key '{key}': {e}")
+            logger.exception("An exception occurred")
+            raise
+
+    async def find_all_by_key(self, meta, keys: List[Any]) -> Optional[List[BaseEntity]]:
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return []
+        try:
+            condition = build_multi_key_condition(meta["get_by_id_condition"], keys)
+            result_entities = [tree async for tree in self._iter_by_condition(meta, condition)]
+            self.cyoda_service.index_technical_ids(meta, result_entities)
+            keys_set = set(keys)
+            return [base_entity_from_dict(meta["entity_model"], tree) for tree in result_entities
+                    if tree.get("key") in keys_set]
+        except TimeoutError as te:
+            logger.error(f"Timeout while reading keys {keys}: {te}")
+        except Exception as e:
+            logger.error(f"Error reading keys {keys}: {e}")
+            logger.exception("An exception occurred")
+        return None
+
+    async def find_all(self, meta) -> List[Any]:
+        return [entity async for entity in self.iter_all(meta)]
+
+    async def iter_all(self, meta, page_size=SEARCH_PAGE_SIZE) -> AsyncIterator[Any]:
+        condition = meta.get("condition", ALL_ENTITIES_CONDITION)
+        async for tree in self._iter_by_condition(meta, condition, page_size):
+            if is_entity_registered(meta["entity_model"]):
+                yield base_entity_from_dict(meta["entity_model"], tree)
+            else:
+                yield tree
+
+    async def count(self, meta) -> int:
+        snapshot_id = await self._create_and_wait_for_snapshot(meta, meta.get("condition", ALL_ENTITIES_CONDITION))
+        if not snapshot_id:
+            return 0
+        first_page = await self._get_search_result(meta["token"], snapshot_id, page_size=1, page_number=0)
+        return first_page.get("page", {}).get("totalElements", 0)
+
+    async def save_all(self, meta, entities: List[BaseEntity]) -> bool:
+        path = f"entity/JSON/TREE/{meta['entity_model']}/{meta['entity_version']}"
+        data = encode_entities(entities)
+        response = await send_post_request(meta["token"], API_URL, path, data=data)
+        technical_ids = CyodaService._get_saved_entity_ids(response)
+        if len(technical_ids) == len(entities):
+            for entity, technical_id in zip(entities, technical_ids):
+                entity.technical_id = technical_id
+                self.cyoda_service.index_technical_id(meta, entity.get_key(), technical_id)
+        else:
+            logger.warning(f"Expected {len(entities)} entity ids in save response, got {len(technical_ids)}")
+        return True
+
+    async def update_all(self, meta, entities: List[Any]) -> List[Any]:
+        if not entities:
+            return entities
+        payload = [{
+            "id": entity.technical_id,
+            "transition": meta["update_transition"],
+            "payload": encode_entity(entity).decode("utf-8")
+        } for entity in entities]
+        response = await send_put_request(meta["token"], API_URL, "entity/JSON/TREE", data=dumps(payload))
+        if response.status_code != 200:
+            raise Exception(f"Update entities failed: {response.status_code} {response.text}")
+        for entity in entities:
+            self.cyoda_service.index_technical_id(meta, entity.get_key(), entity.technical_id)
+        return entities
+
+    async def delete_all(self, meta) -> None:
+        path = f"entity/TREE/{meta['entity_model']}/{meta['entity_version']}"
+        response = await send_delete_request(meta["token"], API_URL, path)
+        if response.status_code != 200:
+            raise Exception(f"Deletion failed: {response.status_code} {response.text}")
+        self.cyoda_service.forget_technical_ids(meta)
+
+    async def _get_by_known_technical_id(self, meta, key) -> Optional[BaseEntity]:
+        technical_id = self.cyoda_service.get_known_technical_id(meta, key)
+        if technical_id is None:
+            return None
+        tree = None
+        try:
+            response = await send_get_request(meta["token"], API_URL, f"entity/TREE/{technical_id}")
+            if response.status_code == 200:
+                tree = CyodaService.tree_from_content(response.content)
+        except Exception as e:
+            logger.warning(f"Reading entity '{technical_id}' for key '{key}' failed, falling back to search: {e}")
+        return self.cyoda_service.entity_from_known_tree(meta, key, technical_id, tree)
+
+    async def _search_by_condition(self, meta, condition, page_size=SEARCH_PAGE_SIZE):
+        snapshot_id = await self._create_and_wait_for_snapshot(meta, condition)
+        if not snapshot_id:
+            return None
+        return await self._get_search_result(meta["token"], snapshot_id, page_size, 0)
+
+    async def _iter_by_condition(self, meta, condition, page_size=SEARCH_PAGE_SIZE) -> AsyncIterator[dict]:
+        snapshot_id = await self._create_and_wait_for_snapshot(meta, condition)
+        if not snapshot_id:
+            return
+        page_number = 0
+        next_page = asyncio.ensure_future(self._get_search_result(meta["token"], snapshot_id, page_size, page_number))
+        try:
+            while next_page is not None:
+                search_result = await next_page
+                total_pages = search_result.get("page", {}).get("totalPages", 0)
+                page_number += 1
+                # The next page is requested while the current one is consumed
+                next_page = asyncio.ensure_future(
+                    self._get_search_result(meta["token"], snapshot_id, page_size, page_number)) \
+                    if page_number < total_pages else None
+                for tree in CyodaService.convert_to_entities(search_result) or []:
+                    yield tree
+        finally:
+            if next_page is not None and not next_page.done():
+                next_page.cancel()
+
+    async def _create_and_wait_for_snapshot(self, meta, condition, timeout=60, interval=5, max_interval=500):
+        search_url = f"treeNode/search/snapshot/{meta['entity_model']}/{meta['entity_version']}"
+        response = await send_post_request(meta["token"], API_URL, search_url, data=json.dumps(condition))
+        if response.status_code != 200:
+            raise Exception(f"Snapshot search trigger failed: {response.status_code} {response.text}")
+        snapshot_id = response.json()
+        if not snapshot_id:
+            logger.error(f"Snapshot ID not found in response: {snapshot_id}")
+            return None
+
+        start_time = now()
+        while True:
+            status_response = await send_get_request(meta["token"], API_URL,
+                                                     f"treeNode/search/snapshot/{snapshot_id}/status")
+            if status_response.status_code != 200:
+                raise Exception(f"Snapshot search trigger failed: {status_response.status_code} {status_response.text}")
+            if CyodaService.is_search_complete(status_response.json(), start_time, timeout):
+                return snapshot_id
+            await asyncio.sleep(interval / 1000)
+            interval = min(interval * 2, max_interval)
+
+    @staticmethod
+    async def _get_search_result(token, snapshot_id, page_size, page_number):
+        params = {
+            'pageSize': f"{page_size}",
+            'pageNumber': f"{page_number}"
+        }
+        response = await send_get_request(token, API_URL, f"treeNode/search/snapshot/{snapshot_id}", params=params)
+        if response.status_code == 200:
+            return loads(response.content)
+        else:
+            raise Exception(f"Get search result failed: {response.status_code} {response.text}")
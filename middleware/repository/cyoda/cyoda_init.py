@@ -1,37 +1,147 @@
+import hashlib
 import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from common_utils.config import CYODA_ENTITY_VERSION
-from middleware._auth.auth import authenticate
+from common_utils.config import (CYODA_ENTITY_VERSION,
+                                 CYODA_CHAT_HISTORY_ENTITY_VERSION,
+                                 CYODA_INIT_WORKERS,
+                                 CYODA_INIT_FINGERPRINT_PATH,
+                                 API_URL)
+from middleware._auth.auth import get_service_token
+from middleware.entity.chat_history_entity import CHAT_HISTORY_ENTITY
 from middleware.ingestion.data_ingestion import import_mapping
 from middleware.repository.cyoda.cyoda_service import CyodaService
 
 logger = logging.getLogger('django')
 
+EMPTY_MAPPING_FILE = Path(__file__).resolve().parent / 'empty_mapping.json'
+
+# Models whose schema changed after it was locked are registered under their own version
+ENTITY_MODEL_VERSIONS = {
+    CHAT_HISTORY_ENTITY: CYODA_CHAT_HISTORY_ENTITY_VERSION,
+}
+# Fields an already registered model version must have, writes carrying them fail otherwise
+ENTITY_MODEL_REQUIRED_FIELDS = {
+    CHAT_HISTORY_ENTITY: ["segments"],
+}
+
+
+class EntityModelMismatchError(Exception):
+    pass
+
+
 def init_cyoda(cyoda_repository: CyodaService):
     entity_dir = Path(__file__).resolve().parent / 'entity'
-    token = authenticate()
-    for json_file in entity_dir.glob('*/**/*.json'):
+    entity_files = _get_entity_files(entity_dir)
+
+    # A restart with unchanged schemas against the same environment has nothing to bootstrap
+    fingerprint = _compute_fingerprint(entity_files + [EMPTY_MAPPING_FILE])
+    if _read_fingerprint() == fingerprint:
+        logger.info("Cyoda entity schemas unchanged since the last bootstrap, skipping init_cyoda")
+        return
+
+    token = get_service_token()
+    with ThreadPoolExecutor(max_workers=CYODA_INIT_WORKERS, thread_name_prefix="cyoda-init") as executor:
+        results = list(executor.map(lambda json_file: _init_entity_model(cyoda_repository, token, json_file),
+                                     entity_files))
+    mapping_saved = save_empty_mapping(token)
+    token = None
+
+    if all(results) and mapping_saved:
+        _write_fingerprint(fingerprint)
+    else:
+        logger.warning("Cyoda bootstrap incomplete, it will be repeated on the next start")
+
+
+def _get_entity_files(entity_dir: Path):
+    entity_files = []
+    for json_file in sorted(entity_dir.glob('*/**/*.json')):
         # Ensure the JSON file is in an immediate subdirectory
         if json_file.parent.parent.name != entity_dir.name:
             continue
+        entity_files.append(json_file)
+    return entity_files
+
+
+def _init_entity_model(cyoda_repository: CyodaService, token, json_file: Path) -> bool:
+    try:
+        with open(json_file, 'r') as file:
+            entity = file.read()
+            entity_name = json_file.name.replace(".json", "")
+            version = get_entity_model_version(entity_name)
+            exported_model = cyoda_repository._export_model(token, entity_name, version)
+            if exported_model is None:
+                save_response = cyoda_repository._save_entity_schema(token, entity_name, version, entity)
+                lock_response = cyoda_repository._lock_entity_schema(token, entity_name, version, None)
+                return _is_successful(save_response) and _is_successful(lock_response)
+            _check_required_fields(entity_name, version, exported_model)
+            return True
+    except EntityModelMismatchError:
+        raise
+    except Exception as e:
+        logger.error(f"Error reading {json_file}: {e}")
+        return False
+
+
+def _check_required_fields(entity_name: str, version, exported_model: str) -> None:
+    missing = [field for field in ENTITY_MODEL_REQUIRED_FIELDS.get(entity_name, [])
+               if not re.search(rf"\b{re.escape(field)}\b", exported_model)]
+    if missing:
+        raise EntityModelMismatchError(
+            f"Registered model '{entity_name}' version {version} lacks the fields {missing} and is locked. "
+            f"Configure an unused model version for it, e.g. CYODA_CHAT_HISTORY_ENTITY_VERSION.")
+
+
+def get_entity_model_version(entity_name: str) -> str:
+    return ENTITY_MODEL_VERSIONS.get(entity_name, CYODA_ENTITY_VERSION)
+
+
+def _is_successful(response) -> bool:
+    return getattr(response, "status_code", None) == 200
+
+
+def save_empty_mapping(token) -> bool:
+    try:
+        with open(EMPTY_MAPPING_FILE, 'r') as file:
+            data = file.read()
+            import_mapping(token, data)
+        return True
+    except Exception as e:
+        logger.error(f"Error importing {EMPTY_MAPPING_FILE}: {e}")
+        return False
+
+
+def _compute_fingerprint(files) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"{API_URL}|{CYODA_ENTITY_VERSION}|{sorted(ENTITY_MODEL_VERSIONS.items())}".encode("utf-8"))
+    for file_path in files:
+        digest.update(str(file_path.name).encode("utf-8"))
+        digest.update(file_path.read_bytes())
+    return digest.hexdigest()
+
+
+def _get_fingerprint_path() -> str:
+    return CYODA_INIT_FINGERPRINT_PATH or os.path.join(tempfile.gettempdir(), "cyoda_init.fingerprint")
 
-        try:
-            with open(json_file, 'r') as file:
-                entity = file.read()
-                entity_name = json_file.name.replace(".json", "")
-                if not cyoda_repository._model_exists(token, entity_name, CYODA_ENTITY_VERSION):
-                    cyoda_repository._save_entity_schema(token, entity_name, CYODA_ENTITY_VERSION, entity)
-                    cyoda_repository._lock_entity_schema(token, entity_name, CYODA_ENTITY_VERSION, None)
-        except Exception as e:
-            logger.error(f"Error reading {json_file}: {e}")
-    save_empty_mapping(token)
-    token = None
 
+def _read_fingerprint():
+    try:
+        with open(_get_fingerprint_path(), 'r') as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Unable to read Cyoda bootstrap fingerprint: {e}")
+        return None
 
-def save_empty_mapping(token):
-    json_file = Path(__file__).resolve().parent / 'empty_mapping.json'
-    with open(json_file, 'r') as file:
-        data = file.read()
-        import_mapping(token, data)
 
+def _write_fingerprint(fingerprint: str) -> None:
+    try:
+        with open(_get_fingerprint_path(), 'w') as file:
+            file.write(fingerprint)
+    except Exception as e:
+        logger.warning(f"Unable to record Cyoda bootstrap fingerprint: {e}")
@@ -1,14 +1,19 @@
 import json
 import threading
 import time
-from typing import List, Any, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Any, Optional, Iterator
 
 import logging
 
 from middleware.entity.entity import BaseEntity
-from middleware.entity.entity_factory import base_entity_from_dict
+from middleware.entity.entity_codec import encode_entities, encode_entity, dumps, loads
+from middleware.entity.entity_factory import base_entity_from_dict, is_entity_registered
+from middleware.repository.conditions import matches_condition, build_multi_key_condition
 from middleware.repository.crud_repository import CrudRepository
 from common_utils.config import (CYODA_AI_IMPORT_MODEL_PATH,
+                                 CYODA_TECHNICAL_ID_INDEX_SIZE,
                                  API_URL
                                  )
 from common_utils.utils import (send_get_request,
@@ -18,6 +23,13 @@ from common_utils.utils import (send_get_request,
 
 logger = logging.getLogger('django')
 
+ALL_ENTITIES_CONDITION = {
+    "operator": "AND",
+    "conditions": [],
+    "type": "group"
+}
+SEARCH_PAGE_SIZE = 100
+
 
 class CyodaService(CrudRepository):
     _instance = None
@@ -29,16 +41,24 @@ class CyodaService(CrudRepository):
             with cls._lock:
                 if cls._instance is None:
                     cls._instance = super(CyodaService, cls).__new__(cls)
+                    # (entity_model, entity_version, key) -> technical_id, least recently used first
+                    cls._instance._technical_ids = OrderedDict()
+                    cls._instance._technical_ids_lock = threading.Lock()
         return cls._instance
 
     def __init__(self):
         pass
 
     def count(self, meta) -> int:
-        pass
+        snapshot_id = self._create_and_wait_for_snapshot(meta, meta.get("condition", ALL_ENTITIES_CONDITION))
+        if not snapshot_id:
+            return 0
+        first_page = self._get_search_result(meta["token"], snapshot_id, page_size=1, page_number=0)
+        return first_page.get("page", {}).get("totalElements", 0)
 
     def delete_all(self, meta) -> None:
-        pass
+        self._delete_all_entities(meta["token"], meta["entity_model"], meta["entity_version"])
+        self.forget_technical_ids(meta)
 
     def delete_all_entities(self, meta, entities: List[Any]) -> None:
         pass
@@ -53,7 +73,19 @@ class CyodaService(CrudRepository):
         pass
 
     def find_all(self, meta) -> List[BaseEntity]:
-        pass
+        return list(self.iter_all(meta))
+
+    def iter_all(self, meta, page_size=SEARCH_PAGE_SIZE) -> Iterator[Any]:
+        """
+        Lazily yields all entities matching meta["condition"] (all entities by default), page by page.
+        Registered entity models are converted to entities, other models are yielded as raw trees.
+        """
+        condition = meta.get("condition", ALL_ENTITIES_CONDITION)
+        for tree in self._iter_by_condition(meta, condition, page_size):
+            if is_entity_registered(meta["entity_model"]):
+                yield base_entity_from_dict(meta["entity_model"], tree)
+            else:
+                yield tree
 
     def find_all_by_key(self, meta, keys: List[Any]) -> List[BaseEntity]:
         return self._get_all_by_ids(meta, keys)
@@ -71,12 +103,52 @@ class CyodaService(CrudRepository):
         return self._update_entities(meta, entities)
 
     def _search_entities(self, meta, key):
+        return self._search_by_condition(meta, meta["get_by_id_condition"])
+
+    def _search_by_condition(self, meta, condition, page_size=SEARCH_PAGE_SIZE):
+        snapshot_id = self._create_and_wait_for_snapshot(meta, condition)
+        if not snapshot_id:
+            return None
+
+        # Retrieve search results
+        search_result = self._get_search_result(
+            token=meta["token"],
+            snapshot_id=snapshot_id,
+            page_size=page_size,  # Adjust page size as needed
+            page_number=0  # Starting with the first page
+        )
+        return search_result
+
+    def _iter_by_condition(self, meta, condition, page_size=SEARCH_PAGE_SIZE) -> Iterator[dict]:
+        snapshot_id = self._create_and_wait_for_snapshot(meta, condition)
+        if not snapshot_id:
+            return iter(())
+        return self._iter_search_results(meta["token"], snapshot_id, page_size)
+
+    def _iter_search_results(self, token, snapshot_id, page_size=SEARCH_PAGE_SIZE) -> Iterator[dict]:
+        """
+        Yields the entity trees of a snapshot page by page. The next page is requested in the
+        background while the current one is consumed, so only two pages are held in memory.
+        """
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot-page-reader") as executor:
+            page_number = 0
+            next_page = executor.submit(self._get_search_result, token, snapshot_id, page_size, page_number)
+            while next_page is not None:
+                search_result = next_page.result()
+                total_pages = search_result.get("page", {}).get("totalPages", 0)
+                page_number += 1
+                next_page = executor.submit(self._get_search_result, token, snapshot_id, page_size, page_number) \
+                    if page_number < total_pages else None
+                for tree in self.convert_to_entities(search_result) or []:
+                    yield tree
+
+    def _create_and_wait_for_snapshot(self, meta, condition):
         # Create a snapshot search
         snapshot_response = self._create_snapshot_search(
             token=meta["token"],
             model_name=meta["entity_model"],
             model_version=meta["entity_version"],
-            condition=meta["get_by_id_condition"]
+            condition=condition
         )
         snapshot_id = snapshot_response
         if not snapshot_id:
@@ -88,73 +160,108 @@ class CyodaService(CrudRepository):
             token=meta["token"],
             snapshot_id=snapshot_id,
             timeout=60,  # Adjust timeout as needed
-            interval=300  # Adjust interval (in milliseconds) as needed
-        )
-
-        # Retrieve search results
-        search_result = self._get_search_result(
-            token=meta["token"],
-            snapshot_id=snapshot_id,
-            page_size=100,  # Adjust page size as needed
-            page_number=1  # Starting with the first page
+            interval=5,  # Initial interval (in milliseconds), doubled after each check
+            max_interval=500
         )
-        return search_result
+        return snapshot_id
 
     def _get_all_by_ids(self, meta, keys) -> List[BaseEntity]:
+        entities = self._get_all_by_ids_in_version(meta, keys)
+        previous_version = meta.get("previous_entity_version")
+        if entities is None or not previous_version:
+            return entities
+        # Entities of the previous model version are included, so e.g. an invalidation also expires them
+        previous_entities = self._get_all_by_ids_in_version(dict(meta, entity_version=previous_version), keys)
+        return entities + (previous_entities or [])
+
+    def _get_all_by_ids_in_version(self, meta, keys) -> List[BaseEntity]:
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return []
         try:
+            # All keys are looked up by a single snapshot search
+            condition = build_multi_key_condition(meta["get_by_id_condition"], keys)
+            result_entities = list(self._iter_by_condition(meta, condition))
+            self.index_technical_ids(meta, result_entities)
+
+            entities_by_key = {}
+            for entity in result_entities:
+                entities_by_key.setdefault(entity.get("key"), []).append(entity)
             entities = []
             for key in keys:
-                search_result = self._search_entities(meta, key)
-                if search_result.get('page').get('totalElements', 0) == 0:
-                    return []
-                result_entities = self.convert_to_entities(search_result)
-                base_entities = [base_entity_from_dict(meta["entity_model"], entity) for entity in result_entities]
-                entities.extend(base_entities)
-                logger.info(f"Successfully retrieved CacheEntity for key '{key}'.")
+                if key not in entities_by_key:
+                    logger.info(f"No entity found for key '{key}'.")
+                    continue
+                entities.extend(base_entity_from_dict(meta["entity_model"], entity) for entity in entities_by_key[key])
+            logger.info(f"Successfully retrieved {len(entities)} entities for {len(keys)} keys.")
             return entities
 
-
         except TimeoutError as te:
-            logger.error(f"Timeout while reading key '{key}': {te}")
+            logger.error(f"Timeout while reading keys {keys}: {te}")
         except Exception as e:
-            logger.error(f"Error reading key '{key}': {e}")
+            logger.error(f"Error reading keys {keys}: {e}")
             logger.exception("An exception occurred")
 
         return None
 
     def _get_by_id(self, meta, key) -> Optional[BaseEntity]:
+        """
+        Returns None only if the search found no entity for the key. Errors are raised, so callers
+        (e.g. the negative cache) don't take an unavailable Cyoda for a missing entity.
+        A key not found is looked up in the meta's previous_entity_version, if any.
+        """
+        entity = self._get_by_id_in_version(meta, key)
+        previous_version = meta.get("previous_entity_version")
+        if entity is None and previous_version:
+            entity = self._get_by_id_in_version(dict(meta, entity_version=previous_version), key)
+            if entity is not None:
+                logger.info(f"Read key '{key}' from version {previous_version} of '{meta['entity_model']}'.")
+                # Its next write back saves it under the current version
+                entity.technical_id = None
+        return entity
+
+    def _get_by_id_in_version(self, meta, key) -> Optional[BaseEntity]:
         try:
+            entity = self._get_by_known_technical_id(meta, key)
+            if entity is not None:
+                return entity
             search_result = self._search_entities(meta, key)
+            if search_result is None:
+                raise Exception(f"Snapshot search for key '{key}' returned no snapshot")
             # Convert search results to CacheEntity
             if search_result.get('page').get('totalElements', 0) == 0:
                 return None
             result_entities = self.convert_to_entities(search_result)
+            self.index_technical_ids(meta, result_entities)
             entity = base_entity_from_dict(meta["entity_model"], result_entities[0])
             logger.info(f"Successfully retrieved CacheEntity for key '{key}'.")
-            if entity is not None:
-                return entity
-            return None
+            return entity
 
         except TimeoutError as te:
             logger.error(f"Timeout while reading key '{key}': {te}")
+            raise
         except Exception as e:
             logger.error(f"Error reading key '{key}': {e}")
             logger.exception("An exception occurred")
-
-        return None
+            raise
 
     def _save_new_entities(self, meta, entities: List[Any]) -> bool:
         try:
-            entities_data = json.dumps([
-                {key: value for key, value in entity.to_dict().items() if (value is not None and key != "technical_id")}
-                for entity in entities
-            ])
-            self._save_new_entity(
+            entities_data = encode_entities(entities)
+            response = self._save_new_entity(
                 token=meta["token"],
                 model=meta["entity_model"],
                 version=meta["entity_version"],
                 data=entities_data
             )
+            technical_ids = self._get_saved_entity_ids(response)
+            if len(technical_ids) == len(entities):
+                # Later write backs of these entities go through the update path
+                for entity, technical_id in zip(entities, technical_ids):
+                    entity.technical_id = technical_id
+                    self.index_technical_id(meta, entity.get_key(), technical_id)
+            else:
+                logger.warning(f"Expected {len(entities)} entity ids in save response, got {len(technical_ids)}")
             return True
         except Exception as e:
             logger.error(f"Exception occurred while saving entity: {e}")
@@ -164,6 +271,79 @@ class CyodaService(CrudRepository):
     def delete(self, meta, entity: Any) -> None:
         pass
 
+    # Index of known technical ids, so entities read or saved before are fetched by id
+    # instead of running a snapshot search. Shared with AsyncCyodaService.
+    def get_known_technical_id(self, meta, key) -> Optional[Any]:
+        index_key = (meta["entity_model"], meta["entity_version"], key)
+        with self._technical_ids_lock:
+            technical_id = self._technical_ids.get(index_key)
+            if technical_id is not None:
+                self._technical_ids.move_to_end(index_key)
+            return technical_id
+
+    def index_technical_id(self, meta, key, technical_id) -> None:
+        if key is None or technical_id is None:
+            return
+        index_key = (meta["entity_model"], meta["entity_version"], key)
+        with self._technical_ids_lock:
+            self._technical_ids[index_key] = technical_id
+            self._technical_ids.move_to_end(index_key)
+            # Bounded, a forgotten key is found by a search again
+            while len(self._technical_ids) > CYODA_TECHNICAL_ID_INDEX_SIZE:
+                self._technical_ids.popitem(last=False)
+
+    def index_technical_ids(self, meta, trees: List[dict]) -> None:
+        for tree in trees or []:
+            self.index_technical_id(meta, tree.get("key"), tree.get("technical_id"))
+
+    def forget_technical_id(self, meta, key) -> None:
+        with self._technical_ids_lock:
+            self._technical_ids.pop((meta["entity_model"], meta["entity_version"], key), None)
+
+    def forget_technical_ids(self, meta) -> None:
+        """Drops the indexed technical ids of all entities of the meta's entity model version."""
+        with self._technical_ids_lock:
+            self._technical_ids = OrderedDict(
+                (index_key, technical_id) for index_key, technical_id in self._technical_ids.items()
+                if index_key[:2] != (meta["entity_model"], meta["entity_version"]))
+
+    def _get_by_known_technical_id(self, meta, key) -> Optional[BaseEntity]:
+        technical_id = self.get_known_technical_id(meta, key)
+        if technical_id is None:
+            return None
+        try:
+            tree = self._get_entity_tree(meta["token"], technical_id)
+        except Exception as e:
+            logger.warning(f"Reading entity '{technical_id}' for key '{key}' failed, falling back to search: {e}")
+            tree = None
+        return self.entity_from_known_tree(meta, key, technical_id, tree)
+
+    def entity_from_known_tree(self, meta, key, technical_id, tree: Optional[dict]) -> Optional[BaseEntity]:
+        """The entity of a tree read by its indexed technical id, None if it no longer is the entity of the key."""
+        # The entity may have been deleted, replaced or no longer match the condition (e.g. expired)
+        condition = meta.get("get_by_id_condition")
+        if tree is None or tree.get("key") != key or (condition and not matches_condition(tree, condition)):
+            self.forget_technical_id(meta, key)
+            return None
+        tree["technical_id"] = technical_id
+        return base_entity_from_dict(meta["entity_model"], tree)
+
+    @staticmethod
+    def tree_from_content(content) -> Optional[dict]:
+        data = loads(content)
+        return data.get("tree", data) if isinstance(data, dict) else None
+
+    @staticmethod
+    def _get_entity_tree(token, technical_id) -> Optional[dict]:
+        path = f"entity/TREE/{technical_id}"
+        response = send_get_request(token, API_URL, path)
+        if response.status_code == 200:
+            return CyodaService.tree_from_content(response.content)
+        elif response.status_code == 404:
+            return None
+        else:
+            raise Exception(f"Get entity failed: {response.status_code} {response.text}")
+
     @staticmethod
     def _save_entity_schema(token, entity_name, version, data):
         path = f"{CYODA_AI_IMPORT_MODEL_PATH}/JSON/SAMPLE_DATA/{entity_name}/{version}"
@@ -228,14 +408,19 @@ class CyodaService(CrudRepository):
 
     @staticmethod
     def _model_exists(token, model_name, model_version):
+        return CyodaService._export_model(token, model_name, model_version) is not None
+
+    @staticmethod
+    def _export_model(token, model_name, model_version) -> Optional[str]:
+        """The model's SIMPLE_VIEW export, None if the model version doesn't exist."""
         export_model_url = f"treeNode/model/export/SIMPLE_VIEW/{model_name}/{model_version}"
 
         response = send_get_request(token, API_URL, export_model_url)
 
         if response.status_code == 200:
-            return True
+            return response.text
         elif response.status_code == 404:
-            return False
+            return None
         else:
             raise Exception(f"Get: {response.status_code} {response.text}")
 
@@ -270,25 +455,32 @@ class CyodaService(CrudRepository):
         else:
             raise Exception(f"Snapshot search trigger failed: {response.status_code} {response.text}")
 
-    def _wait_for_search_completion(self, token, snapshot_id, timeout=5, interval=10):
+    def _wait_for_search_completion(self, token, snapshot_id, timeout=5, interval=10, max_interval=500):
         start_time = now()  # Record the start time
 
         while True:
             status_response = self._get_snapshot_status(token, snapshot_id)
-            status = status_response.get("snapshotStatus")
-
-            # Check if the status is SUCCESSFUL or FAILED
-            if status == "SUCCESSFUL":
+            if self.is_search_complete(status_response, start_time, timeout):
                 return status_response
-            elif status != "RUNNING":
-                raise Exception(f"Snapshot search failed: {json.dumps(status_response, indent=4)}")
-
-            elapsed_time = now() - start_time
-
-            if elapsed_time > timeout:
-                raise TimeoutError(f"Timeout exceeded after {timeout} seconds")
 
             time.sleep(interval / 1000)  # Wait for the given interval (msec) before checking again
+            # Most searches complete within a few milliseconds, back off exponentially for the slow ones
+            interval = min(interval * 2, max_interval)
+
+    @staticmethod
+    def is_search_complete(status_response: dict, start_time, timeout) -> bool:
+        """
+        True once the snapshot search succeeded, False while it is still running.
+        Raises if it failed or has been running for more than timeout seconds since start_time (msec).
+        """
+        status = status_response.get("snapshotStatus")
+        if status == "SUCCESSFUL":
+            return True
+        elif status != "RUNNING":
+            raise Exception(f"Snapshot search failed: {json.dumps(status_response, indent=4)}")
+        if now() - start_time > timeout * 1000:
+            raise TimeoutError(f"Timeout exceeded after {timeout} seconds")
+        return False
 
     @staticmethod
     def _get_search_result(token, snapshot_id, page_size, page_number):
@@ -299,38 +491,42 @@ class CyodaService(CrudRepository):
             'pageNumber': f"{page_number}"
         }
 
-        response = send_get_request(token=token, api_url=API_URL, path=result_url)
+        response = send_get_request(token=token, api_url=API_URL, path=result_url, params=params)
 
         if response.status_code == 200:
-            return response.json()
+            return loads(response.content)
         else:
             raise Exception(f"Get search result failed: {response.status_code} {response.text}")
 
     @staticmethod
-    def _update_entities(meta, entities: List[Any]) -> List[Any]:
-        path = "entity/JSON/TREE"
-        payload = []
-        for entity in entities:
-            entities_data = {
-                key: value for key, value in entity.to_dict().items()
-                if value is not None and key != "technical_id"
-            }
-
-            payload_json = json.dumps(entities_data)
-
-            payload.append({
-                "id": entity.technical_id,
-                "transition": meta["update_transition"],
-                "payload": payload_json
-            })
-            data = json.dumps(payload)
-            response = send_put_request(meta["token"], API_URL, path, data=data)
-            if response.status_code == 200:
-                return entities
-            else:
-                raise Exception(f"Get search result failed: {response.status_code} {response.text}")
+    def _get_saved_entity_ids(response) -> List[Any]:
+        try:
+            result = response.json()
+        except Exception as e:
+            logger.error(f"Unable to parse save entity response: {e}")
+            return []
+        results = result if isinstance(result, list) else [result]
+        return [technical_id for item in results if isinstance(item, dict)
+                for technical_id in item.get("entityIds", [])]
 
-        return entities
+    def _update_entities(self, meta, entities: List[Any]) -> List[Any]:
+        path = "entity/JSON/TREE"
+        if not entities:
+            return entities
+        payload = [{
+            "id": entity.technical_id,
+            "transition": meta["update_transition"],
+            "payload": encode_entity(entity).decode("utf-8")
+        } for entity in entities]
+        # All entities are updated in a single request
+        data = dumps(payload)
+        response = send_put_request(meta["token"], API_URL, path, data=data)
+        if response.status_code == 200:
+            for entity in entities:
+                self.index_technical_id(meta, entity.get_key(), entity.technical_id)
+            return entities
+        else:
+            raise Exception(f"Update entities failed: {response.status_code} {response.text}")
 
     @staticmethod
     def _update_entity(meta, entities: List[Any]) -> List[Any]:
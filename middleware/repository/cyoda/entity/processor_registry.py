@@ -0,0 +1,183 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, Optional
+
+from common_utils import config
+
+logger = logging.getLogger('django')
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def processor(timeout: Optional[float] = None, max_concurrency: Optional[int] = None):
+    """
+    Decorator for workflow functions overriding the default processor settings,
+    e.g. @processor(timeout=120, max_concurrency=1) for a slow processor.
+    """
+
+    def decorator(func):
+        func.processor_settings = {key: value for key, value in
+                                   (("timeout", timeout), ("max_concurrency", max_concurrency)) if value is not None}
+        return func
+
+    return decorator
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and rejects calls for reset_timeout seconds.
+    Then a single trial call is let through: its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    def allow(self) -> bool:
+        with self._lock:
+            # A trial that never reported back (e.g. cancelled) doesn't keep the circuit half open forever
+            if self._state != CLOSED and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+                self._opened_at = time.monotonic()
+                return True
+            return self._state == CLOSED
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+
+class Processor:
+    """A workflow processor with its own timeout, concurrency cap and circuit breaker."""
+
+    def __init__(self, name: str, func: Callable, timeout: float, max_concurrency: int, breaker: CircuitBreaker):
+        self.name = name
+        self.func = func
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.breaker = breaker
+        self.running = 0
+        # asyncio semaphores belong to an event loop
+        self._slots = weakref.WeakKeyDictionary()
+
+    async def execute(self, executor, call: Callable, *args) -> Any:
+        """
+        Runs call(*args) in the executor. Raises CircuitOpenError while the circuit is open and
+        asyncio.TimeoutError once the processor's timeout elapses.
+        A timed out call keeps its concurrency slot until it actually finishes, so a hanging processor
+        can only use up its own slots.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit open for processor {self.name}")
+        slots = self._get_slots()
+        await slots.acquire()
+        self.running += 1
+        try:
+            future = asyncio.get_running_loop().run_in_executor(executor, call, *args)
+        except Exception:
+            self._release(slots)
+            raise
+        future.add_done_callback(lambda _: self._release(slots))
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "timeout": self.timeout,
+            "max_concurrency": self.max_concurrency,
+            "running": self.running,
+            "circuit": self.breaker.state,
+        }
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        slots = self._slots.get(loop)
+        if slots is None:
+            slots = self._slots[loop] = asyncio.Semaphore(self.max_concurrency)
+        return slots
+
+    def _release(self, slots: asyncio.Semaphore) -> None:
+        self.running -= 1
+        slots.release()
+
+
+class ProcessorRegistry:
+    """
+    Processors by name, built on first use from a name -> function dispatch dict. Settings come from, in order
+    of precedence: GRPC_PROCESSOR_SETTINGS ({"<name>": {"timeout": .., "max_concurrency": ..}}),
+    the @processor decorator, and the GRPC_PROCESSOR_TIMEOUT / GRPC_PROCESSOR_MAX_CONCURRENCY defaults.
+    """
+
+    def __init__(self, dispatch: Dict[str, Callable]):
+        self.dispatch = dispatch
+        self._processors = {}
+        self._lock = threading.Lock()
+        self._settings = self._load_settings()
+
+    def is_registered(self, name: str) -> bool:
+        return name in self.dispatch
+
+    def get(self, name: str) -> Processor:
+        func = self.dispatch.get(name)
+        if func is None:
+            raise ValueError(f"Unknown processing step: {name}")
+        with self._lock:
+            registered = self._processors.get(name)
+            if registered is None or registered.func is not func:
+                settings = dict(getattr(func, "processor_settings", {}))
+                settings.update(self._settings.get(name, {}))
+                registered = self._processors[name] = Processor(
+                    name=name,
+                    func=func,
+                    timeout=float(settings.get("timeout", config.CYODA_GRPC_PROCESSOR_TIMEOUT)),
+                    max_concurrency=int(settings.get("max_concurrency", config.CYODA_GRPC_PROCESSOR_MAX_CONCURRENCY)),
+                    breaker=CircuitBreaker(config.CYODA_GRPC_PROCESSOR_FAILURE_THRESHOLD,
+                                           config.CYODA_GRPC_PROCESSOR_RESET_TIMEOUT)
+                )
+            return registered
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {name: registered.snapshot() for name, registered in self._processors.items()}
+
+    @staticmethod
+    def _load_settings() -> Dict[str, dict]:
+        try:
+            return json.loads(config.CYODA_GRPC_PROCESSOR_SETTINGS or "{}")
+        except ValueError as e:
+            logger.error(f"Invalid GRPC_PROCESSOR_SETTINGS, using the defaults: {e}")
+            return {}
@@ -1,11 +1,12 @@
 import inspect
+import logging
 
 from middleware.repository.cyoda.entity.cache_entity import workflow as cache_workflow
 from middleware.repository.cyoda.entity.chat_history_entity import workflow as chat_workflow
+from middleware.repository.cyoda.entity.processor_registry import ProcessorRegistry
 
+logger = logging.getLogger('django')
 
-process_dispatch = {
-}
 
 def build_process_dispatch(workflow_module):
     """Builds a dictionary of public functions from the given workflow module."""
@@ -15,6 +16,20 @@ def build_process_dispatch(workflow_module):
         if not name.startswith("_")  # Filter out private functions
     }
 
+
+def merge_process_dispatch(*dispatches):
+    """Merges the dispatch dictionaries of several workflow modules, the first module defining a name wins."""
+    merged = {}
+    for dispatch in dispatches:
+        for name, func in dispatch.items():
+            if name in merged and merged[name] is not func:
+                logger.error(f"Processor '{name}' is defined by more than one workflow module, "
+                             f"keeping {merged[name].__module__}.{name}")
+                continue
+            merged[name] = func
+    return merged
+
+
 def process_event(token, data, processor_name):
     meta = {"token": token, "entity_model": "ENTITY_PROCESSED_NAME", "entity_version": "ENTITY_VERSION"}
     # data = data['payload']['data']
@@ -27,4 +42,5 @@ def process_event(token, data, processor_name):
 cache_process_dispatch = build_process_dispatch(cache_workflow)
 chat_process_dispatch = build_process_dispatch(chat_workflow)
 
-
+process_dispatch = merge_process_dispatch(cache_process_dispatch, chat_process_dispatch)
+processor_registry = ProcessorRegistry(process_dispatch)
@@ -0,0 +1,151 @@
+import copy
+import logging
+import threading
+from typing import List, Any, Optional
+
+from common_utils.utils import generate_uuid
+from middleware.entity.entity import BaseEntity
+from middleware.entity.entity_factory import base_entity_from_dict, is_entity_registered
+from middleware.repository.conditions import matches_condition, build_multi_key_condition
+from middleware.repository.crud_repository import CrudRepository
+
+logger = logging.getLogger('django')
+
+
+class _ModelStore:
+    """Entities of a single entity model/version with hash indexes on technical_id and key."""
+
+    def __init__(self):
+        self.by_technical_id = {}
+        self.by_key = {}
+
+    def put(self, technical_id, data: dict) -> None:
+        previous = self.by_technical_id.get(technical_id)
+        if previous is not None and previous.get("key") != data.get("key"):
+            self._unindex_key(previous.get("key"), technical_id)
+        self.by_technical_id[technical_id] = data
+        self.by_key.setdefault(data.get("key"), set()).add(technical_id)
+
+    def remove(self, technical_id) -> None:
+        data = self.by_technical_id.pop(technical_id, None)
+        if data is not None:
+            self._unindex_key(data.get("key"), technical_id)
+
+    def find_by_key(self, key) -> List[tuple]:
+        return [(technical_id, self.by_technical_id[technical_id]) for technical_id in self.by_key.get(key, ())]
+
+    def _unindex_key(self, key, technical_id) -> None:
+        technical_ids = self.by_key.get(key)
+        if technical_ids is not None:
+            technical_ids.discard(technical_id)
+            if not technical_ids:
+                del self.by_key[key]
+
+
+class InMemoryCrudRepository(CrudRepository):
+    """
+    CrudRepository kept in process memory, for local mode and for benchmarking the caching stack
+    without network noise. Lookups by key evaluate the same get_by_id_condition Cyoda would.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._stores = {}
+
+    def count(self, meta) -> int:
+        return len(self._find(meta, meta.get("condition")))
+
+    def delete(self, meta, entity: Any) -> None:
+        with self._lock:
+            self._store(meta).remove(entity.technical_id)
+
+    def delete_all(self, meta) -> None:
+        with self._lock:
+            self._stores.pop((meta["entity_model"], meta["entity_version"]), None)
+
+    def delete_all_entities(self, meta, entities: List[Any]) -> None:
+        with self._lock:
+            store = self._store(meta)
+            for entity in entities:
+                store.remove(entity.technical_id)
+
+    def delete_all_by_key(self, meta, keys: List[Any]) -> None:
+        with self._lock:
+            store = self._store(meta)
+            for key in keys:
+                for technical_id, _ in store.find_by_key(key):
+                    store.remove(technical_id)
+
+    def delete_by_key(self, meta, key: Any) -> None:
+        self.delete_all_by_key(meta, [key])
+
+    def exists_by_key(self, meta, key: Any) -> bool:
+        return self.find_by_key(meta, key) is not None
+
+    def find_all(self, meta) -> List[BaseEntity]:
+        return self._find(meta, meta.get("condition"))
+
+    def find_all_by_key(self, meta, keys: List[Any]) -> List[BaseEntity]:
+        condition = meta.get("get_by_id_condition")
+        if condition is not None:
+            condition = build_multi_key_condition(condition, keys)
+        with self._lock:
+            store = self._store(meta)
+            candidates = [item for key in dict.fromkeys(keys) for item in store.find_by_key(key)]
+            return [self._to_entity(meta, technical_id, data) for technical_id, data in candidates
+                    if condition is None or matches_condition(data, condition)]
+
+    def find_by_key(self, meta, key: Any) -> Optional[BaseEntity]:
+        condition = meta.get("get_by_id_condition")
+        with self._lock:
+            for technical_id, data in self._store(meta).find_by_key(key):
+                if condition is None or matches_condition(data, condition):
+                    return self._to_entity(meta, technical_id, data)
+        return None
+
+    def save(self, meta, entity: Any) -> Any:
+        self.save_all(meta, [entity])
+        return entity.technical_id
+
+    def save_all(self, meta, entities: List[BaseEntity]) -> bool:
+        with self._lock:
+            store = self._store(meta)
+            for entity in entities:
+                entity.technical_id = str(generate_uuid())
+                store.put(entity.technical_id, self._to_data(entity))
+        return True
+
+    def update_all(self, meta, entities: List[BaseEntity]) -> List[BaseEntity]:
+        with self._lock:
+            store = self._store(meta)
+            for entity in entities or []:
+                if entity.technical_id not in store.by_technical_id:
+                    raise Exception(f"Update failed: entity '{entity.technical_id}' not found")
+                store.put(entity.technical_id, self._to_data(entity))
+        return entities
+
+    def _store(self, meta) -> _ModelStore:
+        store_key = (meta["entity_model"], meta["entity_version"])
+        store = self._stores.get(store_key)
+        if store is None:
+            store = self._stores[store_key] = _ModelStore()
+        return store
+
+    def _find(self, meta, condition) -> List[Any]:
+        with self._lock:
+            return [self._to_entity(meta, technical_id, data)
+                    for technical_id, data in self._store(meta).by_technical_id.items()
+                    if condition is None or matches_condition(data, condition)]
+
+    @staticmethod
+    def _to_data(entity) -> dict:
+        # Stored as a detached copy, like a round trip to Cyoda
+        return {key: value for key, value in entity.to_dict().items() if value is not None and key != "technical_id"}
+
+    @staticmethod
+    def _to_entity(meta, technical_id, data: dict) -> Any:
+        tree = copy.deepcopy(data)
+        tree["technical_id"] = technical_id
+        if is_entity_registered(meta["entity_model"]):
+            return base_entity_from_dict(meta["entity_model"], tree)
+        return tree
@@ -1,8 +1,10 @@
 from typing import Dict, Optional
 
+from common_utils.config import CACHE_DB
 from middleware.repository.cyoda.cyoda_init import init_cyoda
 from middleware.repository.cyoda.cyoda_service import CyodaService
 from middleware.repository.crud_repository import CrudRepository, DBKeys
+from middleware.repository.in_memory.in_memory_repository import InMemoryCrudRepository
 
 
 class RepositoryRegistry:
@@ -18,7 +20,11 @@ class RepositoryRegistry:
     def _initialize_services(self):
         self.register(DBKeys.CYODA.value,
                       CyodaService())
-        init_cyoda(CyodaService())
+        self.register(DBKeys.IN_MEMORY.value,
+                      InMemoryCrudRepository())
+        # Local mode runs without a Cyoda environment to bootstrap
+        if CACHE_DB != DBKeys.IN_MEMORY.value:
+            init_cyoda(CyodaService())
 
     def register(self, name: str, service_instance: CrudRepository):
         if not isinstance(service_instance, CrudRepository):
@@ -1,2 +1,117 @@
-from django.test import TestCase
+import base64
+import json
+import time
+from unittest import mock
 
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from middleware._auth.auth import TokenProvider
+from middleware.caching.persistent_cache_service import PersistentCachingService
+from middleware.entity.cache_entity import CacheEntity
+
+
+def _create_caching_service(repository):
+    # The service is a process wide singleton, each test gets its own instance without the flusher thread
+    PersistentCachingService._instance = None
+    with mock.patch("middleware.caching.persistent_cache_service.CACHE_FLUSH_INTERVAL", 0):
+        return PersistentCachingService(repository=repository)
+
+
+class PersistentCachingServiceTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.repository = mock.Mock()
+        self.service = _create_caching_service(self.repository)
+        self.meta = {"token": "token"}
+        self.meta.update(CacheEntity.dummy().get_meta_by_id("key"))
+
+    def tearDown(self):
+        PersistentCachingService._instance = None
+        cache.clear()
+
+    def test_missing_key_is_cached_as_negative_entry(self):
+        self.repository.find_by_key.return_value = None
+
+        self.assertIsNone(self.service.get(self.meta, "key"))
+        self.assertTrue(self.service._has_negative_entry("key"))
+
+    def test_failed_lookup_is_not_cached_as_negative_entry(self):
+        self.repository.find_by_key.side_effect = TimeoutError("Timeout exceeded")
+
+        with self.assertRaises(TimeoutError):
+            self.service.get(self.meta, "key")
+        self.assertFalse(self.service._has_negative_entry("key"))
+
+    def test_write_back_of_existing_entity_sends_save_transition(self):
+        entity = CacheEntity.with_defaults("key", {}, 60)
+        entity.technical_id = "technical-id"
+
+        self.service.write_back(self.meta, [entity])
+
+        self.repository.save_all.assert_not_called()
+        update_meta = self.repository.update_all.call_args[0][0]
+        self.assertEqual(update_meta["update_transition"], self.meta["save_transition"])
+        self.assertNotEqual(update_meta["update_transition"], "invalidate")
+
+    def test_invalidate_sends_invalidate_transition(self):
+        entity = CacheEntity.with_defaults("key", {}, 60)
+        entity.technical_id = "technical-id"
+        self.repository.find_all_by_key.return_value = [entity]
+
+        self.service.invalidate(self.meta, ["key"])
+
+        update_meta = self.repository.update_all.call_args[0][0]
+        self.assertEqual(update_meta["update_transition"], "invalidate")
+
+
+class CacheEntryViewTest(SimpleTestCase):
+
+    # Denied as unauthenticated (401) by DRF's basic authentication, or as forbidden (403)
+    DENIED = (401, 403)
+
+    def _get(self, **headers):
+        from rest_framework.test import APIRequestFactory
+        from middleware.views import CacheEntryView
+        request = APIRequestFactory().get("/api/v1/metrics/cache/entry", {"key": "key"}, **headers)
+        return CacheEntryView.as_view()(request)
+
+    def test_entry_requires_operator_token(self):
+        with mock.patch("common_utils.config.METRICS_ADMIN_TOKEN", "operator-token"):
+            self.assertIn(self._get(HTTP_AUTHORIZATION="Bearer user-token").status_code, self.DENIED)
+            self.assertIn(self._get(HTTP_X_METRICS_TOKEN="wrong-token").status_code, self.DENIED)
+
+    def test_entry_is_disabled_without_operator_token(self):
+        with mock.patch("common_utils.config.METRICS_ADMIN_TOKEN", ""):
+            self.assertIn(self._get(HTTP_X_METRICS_TOKEN="").status_code, self.DENIED)
+
+
+def _create_jwt(expires_at: float) -> str:
+    def encode(value: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(value).encode("utf-8")).decode("utf-8").rstrip("=")
+    return f"{encode({'alg': 'none'})}.{encode({'exp': expires_at})}.signature"
+
+
+class TokenProviderTest(SimpleTestCase):
+
+    def setUp(self):
+        TokenProvider._instance = None
+        self.provider = TokenProvider()
+
+    def tearDown(self):
+        TokenProvider._instance = None
+
+    def _scheduled_refresh_delay(self, lifetime: float, margin: int) -> float:
+        token = _create_jwt(time.time() + lifetime)
+        with mock.patch("middleware._auth.auth.authenticate", return_value=token), \
+                mock.patch("common_utils.config.CYODA_TOKEN_REFRESH_MARGIN", margin), \
+                mock.patch.object(TokenProvider, "_schedule_refresh") as schedule_refresh:
+            self.assertEqual(self.provider.get_token(), token)
+        return schedule_refresh.call_args[0][0]
+
+    def test_refresh_is_scheduled_margin_before_expiry(self):
+        self.assertAlmostEqual(self._scheduled_refresh_delay(lifetime=3600, margin=60), 3540, delta=2)
+
+    def test_short_lived_token_is_refreshed_at_half_its_lifetime(self):
+        self.assertAlmostEqual(self._scheduled_refresh_delay(lifetime=30, margin=60), 15, delta=2)
@@ -0,0 +1,10 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('cache', views.CacheMetricsView.as_view(), name='cache-metrics'),
+    path('cache/entry', views.CacheEntryView.as_view(), name='cache-entry'),
+    path('http', views.HttpMetricsView.as_view(), name='http-metrics'),
+    path('grpc', views.GrpcMetricsView.as_view(), name='grpc-metrics'),
+    path('json-repair', views.JsonRepairMetricsView.as_view(), name='json-repair-metrics'),
+]
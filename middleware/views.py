@@ -1,3 +1,60 @@
-from django.shortcuts import render
+import logging
 
-# Create your views here.
+from rest_framework import status, views
+from rest_framework.response import Response
+
+from common_utils.http_session import get_connection_stats
+from common_utils.json_repair import get_repair_stats
+from middleware.grpc_client.grpc_metrics import GrpcMetrics
+from middleware.permissions import IsMetricsOperator
+from middleware.repository.cyoda.entity.workflow import processor_registry
+from rag_processor.caching_service_factory import get_caching_service
+
+logger = logging.getLogger('django')
+cache_service = get_caching_service()
+
+
+class CacheMetricsView(views.APIView):
+
+    def get(self, request):
+        return Response(cache_service.get_metrics(), status=status.HTTP_200_OK)
+
+
+class CacheEntryView(views.APIView):
+    # Keys identify users' chats, so entries are only shown to operators
+    permission_classes = [IsMetricsOperator]
+
+    def get(self, request):
+        key = request.query_params.get("key")
+        if not key:
+            return Response(
+                {"success": False, "message": "key is missing"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        entry = cache_service.inspect(key)
+        if entry is None:
+            return Response(
+                {"success": False, "message": f"No cache entry for key {key}"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(entry, status=status.HTTP_200_OK)
+
+
+class HttpMetricsView(views.APIView):
+
+    def get(self, request):
+        return Response(get_connection_stats(), status=status.HTTP_200_OK)
+
+
+class GrpcMetricsView(views.APIView):
+
+    def get(self, request):
+        metrics = GrpcMetrics().snapshot()
+        metrics["processors"] = processor_registry.snapshot()
+        return Response(metrics, status=status.HTTP_200_OK)
+
+
+class JsonRepairMetricsView(views.APIView):
+
+    def get(self, request):
+        return Response(get_repair_stats(), status=status.HTTP_200_OK)